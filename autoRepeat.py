@@ -0,0 +1,182 @@
+'''Measure how a terminal delivers the auto-repeat of held keys.
+
+The user holds a combo down for a few seconds; everything the terminal sends is read in bulk and timestamped as it
+arrives, then split into individual sequences. From those, the delay before the first repeat, the repeat rate and its
+jitter, and how often several repeats arrived in the same read (coalescing) are computed.
+
+'''
+from collections import OrderedDict
+import codecs
+import statistics
+import sys
+import time
+
+from terminalOutput import template
+from terminalInput import CTRL_C, QuitException, displayableKey, rawStdin, readChunk, splitSequences
+
+
+defaultCombos = ('Right', 'Ctrl+Right', 'Backspace')
+
+# How long to wait for the first repeat; initial repeat delays are commonly 500-660 ms, and can be set much longer.
+firstRepeatTimeout = 2.0
+
+# How long the terminal has to be quiet between repeats before the key is considered released.
+releaseTimeout = 0.3
+
+
+def captureHeldKey(duration, firstTimeout=None):
+    '''Read everything the terminal sends while a key is held.
+
+    Waits up to `firstTimeout` seconds (forever, if None) for the key to be pressed, and up to `firstRepeatTimeout`
+    seconds for its first repeat; then reads until the terminal has been quiet for `releaseTimeout` seconds, or for at
+    most `duration` seconds (after which the remaining repeats are drained).
+
+    Returns a list of `(timestamp, text)` reads, and the number of bytes drained after `duration`.
+
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+    reads = []
+    drained = 0
+
+    with rawStdin():
+        chunk = readChunk(firstTimeout)
+        if not chunk:
+            return reads, drained
+
+        startTime = time.monotonic()
+        reads.append((startTime, decoder.decode(chunk)))
+
+        timeout = firstRepeatTimeout
+        while time.monotonic() - startTime < duration:
+            chunk = readChunk(timeout)
+            if not chunk:
+                break
+            reads.append((time.monotonic(), decoder.decode(chunk)))
+            timeout = releaseTimeout
+        else:
+            chunk = readChunk(releaseTimeout)
+            while chunk:
+                drained += len(chunk)
+                chunk = readChunk(releaseTimeout)
+
+    return reads, drained
+
+
+def timestampSequences(reads):
+    '''Split the text of `reads` into sequences, each with the time of the read that completed it.
+
+    Returns a list of `(timestamp, readIndex, sequence)`; sequences split across several reads are put back together.
+
+    '''
+    text = ''.join(chunkText for _, chunkText in reads)
+
+    readEnds = []
+    end = 0
+    for _, chunkText in reads:
+        end += len(chunkText)
+        readEnds.append(end)
+
+    sequences = []
+    position = 0
+    readIndex = 0
+    for seq in splitSequences(text):
+        position += len(seq)
+        while readEnds[readIndex] < position:
+            readIndex += 1
+        sequences.append((reads[readIndex][0], readIndex, seq))
+
+    return sequences
+
+
+def analyzeRepeats(reads, drained=0):
+    '''Summarize the auto-repeat in the given reads (see `captureHeldKey`), or return None if nothing was read.
+
+    '''
+    sequences = timestampSequences(reads)
+    if not sequences:
+        return None
+
+    firstTime, pressRead, key = sequences[0]
+    repeats = [(timestamp, readIndex) for timestamp, readIndex, seq in sequences[1:] if seq == key]
+    others = [seq for _, _, seq in sequences[1:] if seq != key]
+
+    perRead = OrderedDict()
+    for _, readIndex in repeats:
+        perRead[readIndex] = perRead.get(readIndex, 0) + 1
+
+    # A repeat that arrived in the same read as the press hides the delay; count that read as coalesced instead.
+    repeatedInPressRead = pressRead in perRead
+
+    # Spread each read's interval over the repeats it delivered, so coalesced repeats don't show up as zero intervals.
+    intervals = []
+    lastTime = None
+    for readIndex, count in perRead.items():
+        readTime = reads[readIndex][0]
+        if lastTime is not None:
+            intervals.extend([(readTime - lastTime) / count] * count)
+        lastTime = readTime
+
+    stats = OrderedDict((
+        ('sequence', key),
+        ('repeats', len(repeats)),
+        ('delay ms', round((repeats[0][0] - firstTime) * 1000, 2) if repeats and not repeatedInPressRead else None),
+        ('rate /s', None),
+        ('interval ms', None),
+        ('jitter ms', None),
+        ('reads', len(reads)),
+        ('coalesced reads', sum(1 for readIndex, count in perRead.items() if count > 1 or readIndex == pressRead)),
+        ('max repeats per read', max(perRead.values(), default=0)),
+        ('drained bytes', drained),
+        ('other sequences', [displayableKey(seq) for seq in others[:10]]),
+    ))
+
+    if intervals:
+        meanInterval = statistics.mean(intervals)
+        stats['rate /s'] = round(1 / meanInterval, 2) if meanInterval > 0 else None
+        stats['interval ms'] = round(meanInterval * 1000, 2)
+        stats['jitter ms'] = round(statistics.pstdev(intervals) * 1000, 2)
+
+    return stats
+
+
+def measureCombo(combo, duration):
+    '''Ask the user to hold `combo`, and return its auto-repeat statistics (None if skipped).
+
+    Raises `QuitException` if the user presses Ctrl+C or `q` instead.
+
+    '''
+    sys.stdout.write(template(
+        'Please {c.bold}hold{c.reset} {c.bold}{c.yellow}{}{c.reset} for about {} seconds '
+        '{c.dark.gray}(tap Space to skip){c.reset}... '
+    ).format(combo, duration))
+    sys.stdout.flush()
+
+    reads, drained = captureHeldKey(duration)
+    # Only look at the first read; anything typed while waiting for a repeat that never came arrives after it.
+    firstText = reads[0][1] if reads else ''
+    if firstText in (CTRL_C, 'q'):
+        raise QuitException()
+    elif firstText == ' ' and combo != 'Space':
+        sys.stdout.write(template('{c.dark.gray}(skipped){c.reset}').format())
+        sys.stdout.flush()
+        return None
+
+    stats = analyzeRepeats(reads, drained)
+    sys.stdout.write(template('{c.userInput}{}{c.reset} x {}').format(displayableKey(stats['sequence']),
+                                                                       stats['repeats'] + 1))
+    sys.stdout.flush()
+    return stats
+
+
+def runRepeatSurvey(combos=None, duration=3.0):
+    '''Measure each of `combos` (default: `defaultCombos`) in turn; returns their statistics by combo.
+
+    '''
+    results = OrderedDict()
+
+    with rawStdin():
+        for combo in combos or defaultCombos:
+            results[combo] = measureCombo(combo, duration)
+            sys.stdout.write('\r\n')
+
+    return results
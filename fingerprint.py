@@ -0,0 +1,251 @@
+'''Identify a terminal from a few keypresses, using a decision tree built from a corpus of survey results.
+
+Each node of the tree asks for the combo whose answer tells the most about which terminal is running (the one with the
+highest information gain over the surveys still matching), and has a branch for each sequence the corpus has recorded
+for it. Building the tree takes a while for large corpora, so it is cached on disk, keyed by a hash of the corpus files;
+nodes only keep a summary of the surveys matching them, so a cached tree can be used without loading the corpus.
+
+'''
+from collections import Counter, OrderedDict
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+
+from surveyModel import SurveyCorpus
+from surveyResults import majorityValue
+
+
+# Bump this whenever the tree format or the way it is built changes, so old cached trees are ignored.
+treeFormat = 2
+
+defaultMaxDepth = 12
+
+# Stop asking once this share of the matching surveys comes from one program, or when no combo tells at least
+# `minGain` bits about which program is running; corpora always have some noise (skipped keys, odd configurations)
+# that isn't worth chasing.
+defaultPurity = 0.95
+minGain = 0.05
+
+numberRE = re.compile(r'\d+')
+
+
+def cacheDir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'term-key-survey')
+
+
+def corpusDigest(paths):
+    '''Return a hash of the contents of the given corpus files (and of the tree format).
+
+    '''
+    digest = hashlib.sha256('fingerprint tree format {}\n'.format(treeFormat).encode('utf-8'))
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):  # pylint: disable=cell-var-from-loop
+                digest.update(block)
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+def _entropy(counts):
+    total = sum(counts.values())
+    return -sum(count / total * math.log2(count / total) for count in counts.values())
+
+
+def _program(environment):
+    return environment.get('terminal program') or environment.get('TERM variable') or '?'
+
+
+def _versionKey(version):
+    return [int(number) for number in numberRE.findall(version)], version
+
+
+def describeSurveys(corpus, candidates):
+    '''Summarize which terminals (and versions) the given candidate surveys came from.
+
+    '''
+    programs = Counter()
+    versions = {}
+    for index in candidates:
+        environment = corpus[index].environment
+        program = _program(environment)
+        programs[program] += 1
+        version = environment.get('terminal version')
+        if version:
+            versions.setdefault(program, set()).add(version)
+
+    description = OrderedDict()
+    for program, count in programs.most_common():
+        programVersions = sorted(versions.get(program, ()), key=_versionKey)
+        if not programVersions:
+            versionRange = None
+        elif len(programVersions) == 1:
+            versionRange = programVersions[0]
+        else:
+            versionRange = '{} - {}'.format(programVersions[0], programVersions[-1])
+
+        description[program] = OrderedDict((('surveys', count), ('versions', versionRange)))
+
+    return description
+
+
+def _buildNode(corpus, labels, candidates, depth, maxDepth, purity, parentPredicted):
+    # For each combo, count the labels of the candidates that recorded each sequence for it.
+    splits = {}
+    for index in candidates:
+        survey = corpus[index]
+        label = labels[index]
+        for comboId, sequenceId in zip(survey.comboIds, survey.sequenceIds):
+            splits.setdefault(comboId, {}).setdefault(sequenceId, Counter())[label] += 1
+
+    # Only keep the predictions that differ from the parent's, and the combos none of the candidates recorded; see
+    # `FingerprintTree.predictedResults`.
+    predicted = OrderedDict()
+    for comboId, branches in splits.items():
+        combo = corpus.comboNames[comboId]
+        totals = Counter({sequenceId: sum(counts.values()) for sequenceId, counts in branches.items()})
+        seq = majorityValue(corpus.sequences[sequenceId] for sequenceId in totals.elements())
+        if combo not in parentPredicted or parentPredicted[combo] != seq:
+            predicted[combo] = seq
+
+    recorded = set(corpus.comboNames[comboId] for comboId in splits)
+
+    node = OrderedDict((('matches', describeSurveys(corpus, candidates)), ('predicted', predicted)))
+    dropped = [combo for combo in parentPredicted if combo not in recorded]
+    if dropped:
+        node['dropped'] = dropped
+
+    labelCounts = Counter(labels[index] for index in candidates)
+    if labelCounts.most_common(1)[0][1] >= purity * len(candidates) or depth >= maxDepth:
+        return node
+
+    parentEntropy = _entropy(labelCounts)
+    bestGain, bestCombo = minGain, None
+    for comboId, branches in splits.items():
+        if len(branches) < 2:
+            continue
+
+        known = sum(sum(counts.values()) for counts in branches.values())
+        remaining = sum(sum(counts.values()) / known * _entropy(counts) for counts in branches.values())
+        # Surveys that never asked for this combo can't be ruled out by it; count them against it.
+        gain = (parentEntropy - remaining) * known / len(candidates)
+        # Break ties by combo name, so the tree doesn't depend on the order surveys were loaded in.
+        if gain > bestGain + 1e-12 or (bestCombo is not None and gain > bestGain - 1e-12
+                                       and corpus.comboNames[comboId] < corpus.comboNames[bestCombo]):
+            bestGain, bestCombo = gain, comboId
+
+    if bestCombo is None:
+        return node
+
+    unasked = []
+    children = {}
+    for index in candidates:
+        survey = corpus[index]
+        try:
+            position = survey.comboIds.index(bestCombo)
+        except ValueError:
+            unasked.append(index)
+            continue
+        children.setdefault(survey.sequenceIds[position], []).append(index)
+
+    childPredicted = OrderedDict((combo, seq) for combo, seq in parentPredicted.items() if combo in recorded)
+    childPredicted.update(predicted)
+
+    node['combo'] = corpus.comboNames[bestCombo]
+    node['branches'] = [
+        [corpus.sequences[sequenceId],
+         _buildNode(corpus, labels, members, depth + 1, maxDepth, purity, childPredicted)]
+        for sequenceId, members in sorted(children.items(), key=lambda item: _sequenceKey(corpus.sequences[item[0]]))
+    ]
+    # Surveys that were never asked for the combo get a subtree of their own, rather than a copy in every branch; it
+    # is only used for answers none of the branches has.
+    if unasked:
+        node['unasked'] = _buildNode(corpus, labels, unasked, depth + 1, maxDepth, purity, childPredicted)
+
+    return node
+
+
+def _sequenceKey(seq):
+    return (seq is not None, seq or '')
+
+
+class FingerprintTree(object):
+    '''A decision tree built from a corpus of surveys; see `build` and `load`.
+
+    Nodes are JSON-friendly mappings with a summary of the surveys still matching (`matches`, see `describeSurveys`)
+    and the sequences they predict for each combo, as differences from the parent node: the `predicted` sequences that
+    changed, and the combos `dropped` because none of the surveys recorded them. Unless they are leaves, they also have
+    the `combo` to ask for, a list of `[sequence, child]` `branches`, and possibly an `unasked` child for the surveys
+    that never asked for that combo.
+
+    '''
+    def __init__(self, root):
+        super().__init__()
+
+        self.root = root
+        self._branchMaps = {}
+
+    @classmethod
+    def build(cls, corpus, maxDepth=defaultMaxDepth, purity=defaultPurity):
+        # Versions of the same terminal usually send the same sequences, so only tell programs apart; the versions a
+        # match could be are reported from the surveys it matched.
+        labels = [sys.intern(_program(survey.environment)) for survey in corpus]
+        return cls(_buildNode(corpus, labels, list(range(len(corpus))), 0, maxDepth, purity, {}))
+
+    @classmethod
+    def load(cls, paths, useCache=True):
+        '''Load the tree for the corpus in the given files, from the cache if possible (without reading the corpus
+        itself), or by building it.
+
+        '''
+        cachePath = os.path.join(cacheDir(), 'fingerprint-{}.json'.format(corpusDigest(paths)))
+
+        if useCache and os.path.exists(cachePath):
+            with open(cachePath) as f:
+                return cls(json.load(f, object_pairs_hook=OrderedDict))
+
+        tree = cls.build(SurveyCorpus.load(paths))
+        if useCache:
+            os.makedirs(cacheDir(), exist_ok=True)
+            with open(cachePath + '.tmp', 'w') as f:
+                json.dump(tree.root, f, separators=(',', ':'))
+            os.replace(cachePath + '.tmp', cachePath)
+
+        return tree
+
+    def child(self, node, seq):
+        '''Return the child of `node` for the answer `seq`, or None if no survey in the corpus recorded that answer.
+
+        '''
+        branchMap = self._branchMaps.get(id(node))
+        if branchMap is None:
+            branchMap = self._branchMaps[id(node)] = {branchSeq: child for branchSeq, child in node['branches']}
+
+        return branchMap.get(seq, node.get('unasked'))
+
+    def children(self, node):
+        children = [child for _, child in node.get('branches', ())]
+        if 'unasked' in node:
+            children.append(node['unasked'])
+
+        return children
+
+    def depth(self, node=None):
+        node = self.root if node is None else node
+        return 1 + max((self.depth(child) for child in self.children(node)), default=-1)
+
+    def predictedResults(self, path):
+        '''Return the most common sequence recorded for each combo by the surveys matching the last node of `path`
+        (a list of nodes, starting from the root).
+
+        '''
+        predicted = OrderedDict()
+        for node in path:
+            for combo in node.get('dropped', ()):
+                del predicted[combo]
+            predicted.update(node['predicted'])
+
+        return predicted
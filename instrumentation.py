@@ -0,0 +1,121 @@
+'''Counters and timers for the interactive input/output loop.
+
+Nothing is counted until `enable()` is called; until then, the hooks in terminalInput and terminalOutput cost a single
+check of `enabled`. Once enabled, stdin and stdout are replaced with equivalent streams that count the system calls
+made on them, and all counts and timings are aggregated per prompt (see `beginPrompt`).
+
+'''
+from collections import OrderedDict
+import io
+import sys
+
+
+enabled = False
+
+_prompts = OrderedDict()
+_current = None
+
+
+class PromptStats(object):
+    def __init__(self):
+        super().__init__()
+
+        self.counts = OrderedDict()
+        self.times = OrderedDict()
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def addTime(self, name, seconds):
+        total, calls = self.times.get(name, (0.0, 0))
+        self.times[name] = (total + seconds, calls + 1)
+
+    def report(self):
+        report = OrderedDict(self.counts)
+        for name, (total, calls) in self.times.items():
+            report['{} calls'.format(name)] = calls
+            report['{} ms'.format(name)] = round(total * 1000, 3)
+
+        return report
+
+
+class CountingFileIO(io.FileIO):
+    '''Raw file that counts the read and write system calls made on it, along with the bytes transferred.
+
+    '''
+    def readinto(self, buffer):
+        result = super().readinto(buffer)
+        count('read syscalls')
+        if result is None:
+            count('empty reads')
+        else:
+            count('bytes read', result)
+        return result
+
+    def write(self, data):
+        result = super().write(data)
+        count('write syscalls')
+        if result is not None:
+            count('bytes written', result)
+        return result
+
+
+class CountingTextIO(io.TextIOWrapper):
+    def flush(self):
+        count('flush calls')
+        return super().flush()
+
+
+def _countingStream(stream, mode):
+    raw = CountingFileIO(stream.fileno(), mode, closefd=False)
+    buffered = io.BufferedReader(raw) if mode == 'r' else io.BufferedWriter(raw)
+    return CountingTextIO(buffered, encoding=stream.encoding, errors=stream.errors,
+                          line_buffering=stream.line_buffering)
+
+
+def enable():
+    '''Start counting; replaces `sys.stdin` and `sys.stdout` with counting equivalents.
+
+    '''
+    global enabled  # pylint: disable=global-statement
+
+    if enabled:
+        return
+
+    sys.stdout.flush()
+    sys.stdin = _countingStream(sys.stdin, 'r')
+    sys.stdout = _countingStream(sys.stdout, 'w')
+
+    enabled = True
+    beginPrompt('startup')
+
+
+def beginPrompt(name):
+    '''Attribute everything counted from now on to the prompt called `name`.
+
+    '''
+    global _current  # pylint: disable=global-statement
+
+    if not enabled:
+        return
+
+    _current = _prompts.get(name)
+    if _current is None:
+        _current = _prompts[name] = PromptStats()
+
+
+def count(name, amount=1):
+    if enabled:
+        _current.count(name, amount)
+
+
+def addTime(name, seconds):
+    if enabled:
+        _current.addTime(name, seconds)
+
+
+def report():
+    '''Return the collected counts and timings as a JSON-friendly mapping of prompt name to statistics.
+
+    '''
+    return OrderedDict((name, stats.report()) for name, stats in _prompts.items())
@@ -0,0 +1,163 @@
+'''Measure how fast the terminal renders different kinds of output.
+
+Each workload is a set of pre-built screenfuls ("frames") of output, written to the terminal over and over for a given
+time. A cursor position report is then requested; since the terminal only answers once it has processed everything
+written before the request, the time until the reply arrives is the time the terminal took to render all of it.
+
+'''
+from collections import OrderedDict
+import os
+import select
+import shutil
+import sys
+import time
+
+from terminalOutput import colors, csi
+from terminalInput import queryCursorPosition, rawStdin
+
+
+enterAltScreen = csi(flag='?1049h')
+exitAltScreen = csi(flag='?1049l')
+home = csi(1, 1, flag='H')
+
+sampleText = 'The quick brown fox jumps over the lazy dog. 0123456789 '
+
+
+def _textLine(columns, offset=0):
+    repeated = sampleText * (columns // len(sampleText) + 2)
+    return repeated[offset % len(sampleText):][:columns - 1]
+
+
+def plainFrames(columns, rows):
+    return [
+        ''.join(_textLine(columns, frame + row) + '\r\n' for row in range(rows))
+        for frame in range(4)
+    ]
+
+
+def indexedFrames(columns, rows):
+    return [
+        ''.join(
+            ''.join(colors.index[(frame + row + col) % 256] + char
+                    for col, char in enumerate(_textLine(columns, frame + row)))
+            + colors.reset + '\r\n'
+            for row in range(rows)
+        )
+        for frame in range(4)
+    ]
+
+
+def truecolorFrames(columns, rows):
+    return [
+        ''.join(
+            ''.join(
+                colors.fg.rgb[(col * 4 + frame * 16) % 256][(row * 8) % 256][(col + row) % 256]
+                + colors.bg.rgb[(row * 4) % 256][(col * 2 + frame * 16) % 256][64]
+                + char
+                for col, char in enumerate(_textLine(columns, frame + row))
+            )
+            + colors.reset + '\r\n'
+            for row in range(rows)
+        )
+        for frame in range(4)
+    ]
+
+
+def scrollFrames(columns, rows):
+    bottom = csi(rows, 1, flag='H')
+    return [
+        ''.join(bottom + csi(1, flag='S') + _textLine(columns, frame + row) for row in range(rows))
+        for frame in range(4)
+    ]
+
+
+def redrawFrames(columns, rows):
+    palette = [colors.red, colors.green, colors.yellow, colors.blue, colors.magenta, colors.cyan]
+    return [
+        home + ''.join(
+            palette[(frame + row) % len(palette)] + _textLine(columns, frame + row)
+            + (csi(row + 2, 1, flag='H') if row + 1 < rows else '')
+            for row in range(rows)
+        ) + colors.reset
+        for frame in range(2)
+    ]
+
+
+workloads = OrderedDict((
+    ('plain', plainFrames),
+    ('256color', indexedFrames),
+    ('truecolor', truecolorFrames),
+    ('scroll', scrollFrames),
+    ('redraw', redrawFrames),
+))
+
+
+def _writeAll(fd, data):
+    # Raw mode leaves the tty non-blocking (for stdin, which shares it with stdout), so wait whenever it's full.
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            select.select([], [fd], [])
+
+
+def runWorkload(name, duration, sync=True):
+    '''Write frames of the workload called `name` for about `duration` seconds, then (if `sync` is true) wait for the
+    terminal to catch up.
+
+    '''
+    columns, rows = shutil.get_terminal_size()
+    frames = [frame.encode('utf-8') for frame in workloads[name](columns, rows)]
+    outputFD = sys.stdout.fileno()
+
+    frameCount = 0
+    byteCount = 0
+
+    startTime = time.monotonic()
+    while time.monotonic() - startTime < duration:
+        frame = frames[frameCount % len(frames)]
+        _writeAll(outputFD, frame)
+        frameCount += 1
+        byteCount += len(frame)
+
+    writtenTime = time.monotonic()
+    synced = sync and queryCursorPosition(timeout=max(10.0, duration * 10)) is not None
+    elapsed = time.monotonic() - startTime
+
+    return OrderedDict((
+        ('frames', frameCount),
+        ('bytes', byteCount),
+        ('seconds', round(elapsed, 4)),
+        ('write seconds', round(writtenTime - startTime, 4)),
+        ('synced', synced),
+        ('MB/s', round(byteCount / elapsed / 1e6, 3)),
+        ('frames/s', round(frameCount / elapsed, 2)),
+        ('screen size', '{}x{}'.format(columns, rows)),
+    ))
+
+
+def runBenchmarks(names=None, duration=2.0):
+    '''Run each of the named workloads (default: all of them) on the alternate screen, and return their results.
+
+    If the terminal doesn't answer cursor position queries, `synced` is False and the timings only cover writing the
+    output, not rendering it.
+
+    '''
+    results = OrderedDict()
+
+    sys.stdout.flush()
+    with rawStdin():
+        sync = queryCursorPosition() is not None
+
+        sys.stdout.write(enterAltScreen)
+        try:
+            for name in names or workloads:
+                sys.stdout.write(home + csi(2, flag='J'))
+                sys.stdout.flush()
+                results[name] = runWorkload(name, duration, sync)
+        finally:
+            sys.stdout.write(colors.reset + exitAltScreen)
+            sys.stdout.flush()
+
+    return results
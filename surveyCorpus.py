@@ -0,0 +1,197 @@
+'''Generate synthetic corpora of survey results, for testing the tools at scale.
+
+Every synthetic survey starts from one of a set of real surveys (its seed profile), and then has a few realistic
+mutations applied: version drift, missing or skipped combos, an alternate modifier scheme, and extra keys. Each survey
+is generated from its own random number generator, seeded with the corpus seed and the survey's index, so a corpus (or
+any slice of it) can be regenerated exactly.
+
+'''
+from collections import OrderedDict
+import json
+import os
+import random
+import re
+
+from surveyResults import splitCombo
+
+
+# Alternate names for the modifiers, as used by other keyboard types.
+modifierSchemes = OrderedDict((
+    ('Super', OrderedDict((('Windows', 'Super'),))),
+    ('Mac', OrderedDict((('Alt', 'Option'), ('Windows', 'Command')))),
+    ('Meta', OrderedDict((('Alt', 'Meta'), ('Windows', 'Hyper')))),
+))
+
+# xterm-style modifier parameter bits (the parameter sent is 1 + the sum of the bits).
+modifierParamBits = OrderedDict((('Shift', 1), ('Alt', 2), ('Ctrl', 4), ('Windows', 8)))
+
+# Function keys beyond F12, with the `CSI <code> ~` codes rxvt and the Linux console use for them.
+extraKeyCodes = OrderedDict((
+    ('F13', 25), ('F14', 26), ('F15', 28), ('F16', 29), ('F17', 31), ('F18', 32), ('F19', 33), ('F20', 34),
+))
+
+modifiedCursorRE = re.compile(r'^\x1b\[1;(\d+)([A-Z])$')
+modifiedTildeRE = re.compile(r'^\x1b\[(\d+);(\d+)~$')
+numberRE = re.compile(r'\d+')
+
+
+def driftVersion(version, rng):
+    '''Return a plausible nearby version to `version` (or a made-up one, if it's unknown).
+
+    '''
+    if not version or not numberRE.search(version):
+        return '{}.{}.{}'.format(rng.randint(0, 4), rng.randint(0, 30), rng.randint(0, 20))
+
+    numbers = list(numberRE.finditer(version))
+    match = rng.choice(numbers[-2:])
+    bumped = max(0, int(match.group(0)) + rng.randint(-2, 3))
+    return version[:match.start()] + str(bumped) + version[match.end():]
+
+
+def altAsEscapePrefix(seq):
+    '''Rewrite an xterm-style sequence with the Alt bit set in its modifier parameter so that it uses an ESC prefix
+    instead, as terminals with "meta sends escape" do.
+
+    '''
+    match = modifiedCursorRE.match(seq)
+    if match:
+        param, final = int(match.group(1)) - 1, match.group(2)
+        if param & 2:
+            param &= ~2
+            return '\x1b' + ('\x1b[1;{}{}'.format(param + 1, final) if param else '\x1b[' + final)
+        return seq
+
+    match = modifiedTildeRE.match(seq)
+    if match:
+        code, param = match.group(1), int(match.group(2)) - 1
+        if param & 2:
+            param &= ~2
+            return '\x1b' + ('\x1b[{};{}~'.format(code, param + 1) if param else '\x1b[{}~'.format(code))
+
+    return seq
+
+
+class CorpusGenerator(object):
+    '''Produce synthetic surveys based on the given seed `profiles` (survey objects, as returned by `loadResults`).
+
+    The rates are the probability of each mutation being applied to a survey; `maxMissing` is the largest fraction of
+    combos a survey can be missing.
+
+    '''
+    def __init__(self, profiles, seed=0, driftRate=0.7, missingRate=0.5, maxMissing=0.2, schemeRate=0.2,
+                 altPrefixRate=0.2, extraKeyRate=0.3):
+        super().__init__()
+
+        if not profiles:
+            raise ValueError('at least one seed profile is needed')
+
+        self.profiles = profiles
+        self.seed = seed
+        self.driftRate = driftRate
+        self.missingRate = missingRate
+        self.maxMissing = maxMissing
+        self.schemeRate = schemeRate
+        self.altPrefixRate = altPrefixRate
+        self.extraKeyRate = extraKeyRate
+
+    def survey(self, index):
+        '''Return synthetic survey number `index`.
+
+        '''
+        rng = random.Random('{}:{}'.format(self.seed, index))
+        profileIndex = rng.randrange(len(self.profiles))
+        profile = self.profiles[profileIndex]
+
+        environment = OrderedDict(profile['environment'])
+        results = OrderedDict(profile['results'])
+
+        if rng.random() < self.driftRate:
+            environment['terminal version'] = driftVersion(environment.get('terminal version'), rng)
+            environment['platform release'] = driftVersion(environment.get('platform release'), rng)
+
+        if rng.random() < self.altPrefixRate:
+            results = OrderedDict((combo, altAsEscapePrefix(seq) if seq else seq) for combo, seq in results.items())
+
+        if rng.random() < self.extraKeyRate:
+            results.update(self._extraKeys(environment, rng))
+
+        if rng.random() < self.missingRate:
+            fraction = rng.uniform(0, self.maxMissing)
+            for combo in rng.sample(list(results), int(len(results) * fraction)):
+                # About half of the missing combos were skipped; the rest weren't asked at all.
+                if rng.random() < 0.5:
+                    results[combo] = None
+                else:
+                    del results[combo]
+
+        if rng.random() < self.schemeRate:
+            schemeName = rng.choice(list(modifierSchemes))
+            environment, results = self._renameModifiers(environment, results, schemeName)
+
+        environment['Notes'] = 'synthetic #{} (seed {}, profile {})'.format(index, self.seed, profileIndex)
+
+        return OrderedDict((('environment', environment), ('results', results)))
+
+    def _extraKeys(self, environment, rng):
+        modifiers = [mod.strip() for mod in (environment.get('modifiers') or '').split(',') if mod.strip()]
+        extra = OrderedDict()
+
+        for key in rng.sample(list(extraKeyCodes), rng.randint(1, len(extraKeyCodes))):
+            code = extraKeyCodes[key]
+            extra[key] = '\x1b[{}~'.format(code)
+            for mod in modifiers:
+                bit = modifierParamBits.get(mod)
+                extra['{}+{}'.format(mod, key)] = '\x1b[{};{}~'.format(code, bit + 1) if bit else None
+
+        return extra
+
+    @staticmethod
+    def _renameModifiers(environment, results, schemeName):
+        renames = modifierSchemes[schemeName]
+
+        def rename(combo):
+            mods, key = splitCombo(combo)
+            return '+'.join([renames.get(mod, mod) for mod in mods] + [key])
+
+        environment['keyboard type'] = schemeName
+        environment['modifiers'] = ', '.join(
+            renames.get(mod.strip(), mod.strip()) for mod in (environment.get('modifiers') or '').split(',')
+        )
+        return environment, OrderedDict((rename(combo), seq) for combo, seq in results.items())
+
+    def generate(self, count, start=0):
+        '''Yield `count` synthetic surveys, starting from number `start`.
+
+        '''
+        for index in range(start, start + count):
+            yield self.survey(index)
+
+
+def writeJSONL(surveys, path):
+    '''Write `surveys` to `path`, one compact JSON object per line; returns the number written.
+
+    '''
+    written = 0
+    with open(path, 'w') as f:
+        for survey in surveys:
+            f.write(json.dumps(survey, separators=(',', ':')))
+            f.write('\n')
+            written += 1
+
+    return written
+
+
+def writeFiles(surveys, directory):
+    '''Write each of `surveys` to its own file in `directory`, named like term-key-survey.py's output files.
+
+    '''
+    os.makedirs(directory, exist_ok=True)
+
+    written = 0
+    for survey in surveys:
+        path = os.path.join(directory, 'term-key-survey-synthetic-{:07}.json'.format(written))
+        with open(path, 'w') as f:
+            json.dump(survey, f, separators=(',', ':'))
+        written += 1
+
+    return written
@@ -0,0 +1,258 @@
+'''A compact in-memory representation of many survey results.
+
+Loading surveys as plain JSON gives every survey its own dicts, and its own copy of every combo name and sequence.
+Here, all surveys in a `SurveyCorpus` share one table of combo names and one table of sequences; each `Survey` only
+holds two arrays of ids into those tables, and each `Environment` a tuple of interned values laid out according to a
+shared tuple of keys. Converting to and from the JSON schema written by term-key-survey.py is lossless.
+
+'''
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+import sys
+
+from surveyResults import iterResults
+
+
+# Sequence id used for combos that were asked but skipped (`null` in the JSON).
+skippedId = 0
+
+_missing = object()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Environment(object):
+    '''The environment a survey ran in; a read-only mapping with the same keys and values as the JSON object.
+
+    '''
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys, values):
+        super().__init__()
+
+        self.keys = keys
+        self.values = values
+
+    def __getitem__(self, key):
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return zip(self.keys, self.values)
+
+    def toJSON(self):
+        return OrderedDict(self.items())
+
+
+class SurveyResults(Mapping):
+    '''A read-only view of the results of a `Survey`, mapping combo names to sequences like the JSON object does.
+
+    '''
+    __slots__ = ('survey',)
+
+    def __init__(self, survey):
+        super().__init__()
+
+        self.survey = survey
+
+    def __getitem__(self, combo):
+        seq = self.survey.sequenceFor(combo, _missing)
+        if seq is _missing:
+            raise KeyError(combo)
+
+        return seq
+
+    def __iter__(self):
+        comboNames = self.survey.corpus.comboNames
+        return (comboNames[comboId] for comboId in self.survey.comboIds)
+
+    def __len__(self):
+        return len(self.survey.comboIds)
+
+    def items(self):
+        return self.survey.items()
+
+
+class Survey(object):
+    '''The results of one survey; combos and sequences are stored as ids into the tables of its `corpus`.
+
+    Behaves like the JSON object it was converted from, as far as `survey['environment']` and `survey['results']` go.
+
+    '''
+    __slots__ = ('corpus', 'environment', 'comboIds', 'sequenceIds', 'extra')
+
+    def __init__(self, corpus, environment, comboIds, sequenceIds, extra=None):
+        super().__init__()
+
+        self.corpus = corpus
+        self.environment = environment
+        self.comboIds = comboIds
+        self.sequenceIds = sequenceIds
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key == 'environment':
+            return self.environment
+        elif key == 'results':
+            return self.results()
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ('environment', 'results') or (self.extra is not None and key in self.extra)
+
+    def __len__(self):
+        return len(self.comboIds)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def sequenceFor(self, combo, default=None):
+        '''Return the sequence recorded for `combo` (None if it was skipped), or `default` if it wasn't asked.
+
+        '''
+        comboId = self.corpus.comboIndex.get(combo)
+        if comboId is None:
+            return default
+
+        position = self.corpus.comboPositions(self.comboIds).get(comboId)
+        if position is None:
+            return default
+
+        return self.corpus.sequences[self.sequenceIds[position]]
+
+    def items(self):
+        comboNames, sequences = self.corpus.comboNames, self.corpus.sequences
+        return ((comboNames[comboId], sequences[sequenceId])
+                for comboId, sequenceId in zip(self.comboIds, self.sequenceIds))
+
+    def results(self):
+        return SurveyResults(self)
+
+    def toJSON(self):
+        data = OrderedDict((('environment', self.environment.toJSON()), ('results', OrderedDict(self.items()))))
+        if self.extra is not None:
+            data.update(self.extra)
+
+        return data
+
+
+class SurveyCorpus(object):
+    '''A list of `Survey` objects sharing their combo name, sequence, combo layout and environment layout tables.
+
+    '''
+    def __init__(self):
+        super().__init__()
+
+        self.surveys = []
+        self.comboNames = []
+        self.comboIndex = {}
+        self.sequences = [None]
+        self.sequenceIndex = {}
+        self.environmentLayouts = {}
+        self.comboLayouts = {}
+        self._comboPositions = {}
+
+    def __len__(self):
+        return len(self.surveys)
+
+    def __iter__(self):
+        return iter(self.surveys)
+
+    def __getitem__(self, index):
+        return self.surveys[index]
+
+    def comboId(self, combo):
+        comboId = self.comboIndex.get(combo)
+        if comboId is None:
+            comboId = self.comboIndex[sys.intern(combo)] = len(self.comboNames)
+            self.comboNames.append(sys.intern(combo))
+
+        return comboId
+
+    def sequenceId(self, seq):
+        if seq is None:
+            return skippedId
+
+        sequenceId = self.sequenceIndex.get(seq)
+        if sequenceId is None:
+            sequenceId = self.sequenceIndex[seq] = len(self.sequences)
+            self.sequences.append(seq)
+
+        return sequenceId
+
+    def _environment(self, data):
+        keys = tuple(_intern(key) for key in data)
+        keys = self.environmentLayouts.setdefault(keys, keys)
+        return Environment(keys, tuple(_intern(value) for value in data.values()))
+
+    def _comboLayout(self, comboIds):
+        return self.comboLayouts.setdefault(comboIds.tobytes(), comboIds)
+
+    def comboPositions(self, comboIds):
+        '''Return a dict from combo id to its position in `comboIds`, which must be one of this corpus' combo layouts.
+
+        '''
+        # Built on first lookup and shared by every survey with the same layout; most surveys are only ever iterated
+        # over, so they don't need one. Layouts live as long as the corpus, so their ids are stable.
+        positions = self._comboPositions.get(id(comboIds))
+        if positions is None:
+            positions = self._comboPositions[id(comboIds)] = {
+                comboId: position for position, comboId in enumerate(comboIds)}
+
+        return positions
+
+    def add(self, data):
+        '''Convert a survey from its JSON form and add it to the corpus; returns the new `Survey`.
+
+        '''
+        results = data['results']
+        comboIds = self._comboLayout(array('I', (self.comboId(combo) for combo in results)))
+        sequenceIds = array('I', (self.sequenceId(seq) for seq in results.values()))
+
+        extra = OrderedDict((key, value) for key, value in data.items() if key not in ('environment', 'results'))
+
+        survey = Survey(self, self._environment(data['environment']), comboIds, sequenceIds, extra or None)
+        self.surveys.append(survey)
+        return survey
+
+    def extend(self, surveys):
+        for data in surveys:
+            self.add(data)
+
+    def toJSON(self):
+        return [survey.toJSON() for survey in self.surveys]
+
+    @classmethod
+    def load(cls, paths):
+        '''Load the surveys in the given files (in any format `loadResults` accepts) into a new corpus.
+
+        '''
+        corpus = cls()
+        corpus.extend(iterResults(paths))
+        return corpus
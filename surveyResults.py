@@ -0,0 +1,130 @@
+'''Load and organize the results of term-key-survey.py sessions.
+
+'''
+from collections import Counter, OrderedDict
+import glob
+import json
+import re
+
+from terminalInput import displayableKey, displayTokens
+
+
+keyWithModifiersRE = re.compile(r'^(.+)\+([^+]+)$')
+
+
+def iterResults(paths):
+    '''Yield the surveys in the given files one at a time (see `loadResults`); `.jsonl` files are read line by line.
+
+    '''
+    for path in paths:
+        with open(path) as f:
+            if path.endswith('.jsonl'):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line, object_pairs_hook=OrderedDict)
+                continue
+
+            data = json.load(f, object_pairs_hook=OrderedDict)
+
+        if isinstance(data, list):
+            yield from data
+        elif 'surveys' in data:
+            yield from data['surveys']
+        else:
+            yield data
+
+
+def loadResults(paths):
+    '''Load survey results from the given files, each holding either a single survey or a list of surveys.
+
+    Aggregated files (as written by `aggregateResults`) and `.jsonl` files with one survey per line are also accepted.
+    Returns a list of `{'environment': ..., 'results': ...}` objects, in file order.
+
+    '''
+    return list(iterResults(paths))
+
+
+def defaultResultFiles():
+    '''Return the survey files written by term-key-survey.py in the current directory.
+
+    '''
+    return sorted(glob.glob('term-key-survey-*.json'))
+
+
+def splitCombo(combo):
+    '''Split a key combination name like `Shift+Ctrl+Left` into its modifiers and key name.
+
+    '''
+    match = keyWithModifiersRE.match(combo)
+    if not match:
+        return (), combo
+
+    return tuple(match.group(1).split('+')), match.group(2)
+
+
+def allCombos(surveys):
+    '''Return every key combination found in `surveys`, grouped by key name, then by modifiers.
+
+    '''
+    seen = OrderedDict()
+    for survey in surveys:
+        for combo in survey['results']:
+            seen[combo] = None
+
+    def sortKey(combo):
+        mods, key = splitCombo(combo)
+        return key, len(mods), mods
+
+    return sorted(seen, key=sortKey)
+
+
+def terminalLabel(environment):
+    '''Return a short human-readable name for the terminal described by a survey's environment.
+
+    '''
+    program = environment.get('terminal program') or environment.get('TERM variable') or '?'
+    version = environment.get('terminal version')
+
+    return '{} {}'.format(program, version) if version else program
+
+
+def majorityValue(values, default=None):
+    '''Return the most common of `values`, or `default` if there is no clear winner.
+
+    '''
+    counts = Counter(values).most_common(2)
+    if not counts or (len(counts) > 1 and counts[0][1] == counts[1][1]):
+        return default
+
+    return counts[0][0]
+
+
+def displayCache(surveys):
+    '''Render every distinct sequence in `surveys` once, in each of the display modes the viewers use.
+
+    '''
+    cache = OrderedDict()
+
+    for survey in surveys:
+        for seq in survey['results'].values():
+            if seq is None or seq in cache:
+                continue
+
+            cache[seq] = OrderedDict((
+                ('fish', displayableKey(seq, 'fish')),
+                ('readline', displayableKey(seq, 'readline')),
+                ('repr', displayableKey(seq, 'repr')),
+                ('tokens', displayTokens(seq)),
+            ))
+
+    return cache
+
+
+def aggregateResults(surveys):
+    '''Combine several surveys into a single object, along with pre-rendered displays of all of their sequences.
+
+    '''
+    return OrderedDict((
+        ('surveys', surveys),
+        ('display', displayCache(surveys)),
+    ))
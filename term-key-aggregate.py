@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+'''Combine the results of several term-key-survey.py sessions into one file for term-key-viewer, along with
+pre-rendered displays of every sequence.
+
+'''
+# pylint: disable=invalid-name
+
+import argparse
+import json
+import sys
+
+from surveyResults import aggregateResults, defaultResultFiles, loadResults
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('files', metavar='FILE', nargs='*',
+                    help='survey result files to combine (default: term-key-survey-*.json in the current directory)')
+parser.add_argument('-o', '--output', metavar='FILE', help='where to write the combined results (default: stdout)')
+
+
+def main():
+    args = parser.parse_args()
+
+    aggregated = aggregateResults(loadResults(args.files or defaultResultFiles()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(aggregated, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(aggregated, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
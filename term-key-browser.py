@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+'''Browse and compare the results of several term-key-survey.py sessions, directly in the terminal.
+
+'''
+# pylint: disable=invalid-name
+
+import argparse
+import shutil
+import sys
+
+from terminalOutput import console, csi, cursor, template
+from terminalInput import CTRL_C, displayableKey, rawStdin, readKey, splitSequences
+from surveyResults import allCombos, defaultResultFiles, loadResults, majorityValue, splitCombo, terminalLabel
+
+
+maxColumnWidth = 24
+headerRows = 2
+footerRows = 1
+
+noMajority = object()
+
+upKeys = ('\x1b[A', '\x1bOA', 'k')
+downKeys = ('\x1b[B', '\x1bOB', 'j')
+leftKeys = ('\x1b[D', '\x1bOD', 'h')
+rightKeys = ('\x1b[C', '\x1bOC', 'l')
+pageUpKeys = ('\x1b[5~', '\x02')
+pageDownKeys = ('\x1b[6~', '\x06', ' ')
+homeKeys = ('\x1b[H', '\x1bOH', '\x1b[1~', 'g')
+endKeys = ('\x1b[F', '\x1bOF', '\x1b[4~', 'G')
+enterKeys = ('\r', '\n')
+backspaceKeys = ('\x7f', '\x08')
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('files', metavar='FILE', nargs='*',
+                    help='survey result files to load (default: term-key-survey-*.json in the current directory)')
+parser.add_argument('-m', '--modifiers', metavar='MODS', default='',
+                    help='only show combos using all of these comma-separated modifiers ("none" for bare keys)')
+parser.add_argument('-k', '--keys', metavar='KEYS', default='', help='only show these comma-separated keys')
+parser.add_argument('-t', '--terminals', metavar='TERMS', default='',
+                    help='only show terminals whose name contains one of these comma-separated strings')
+parser.add_argument('-d', '--disagreeing', action='store_true',
+                    help='only show combos where some terminal disagrees with the majority')
+
+
+def _splitFilter(text):
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+
+def _fit(text, width):
+    if len(text) > width:
+        return text[:width - 1] + '…'
+
+    return '{: <{}}'.format(text, width)
+
+
+class MatrixView(object):
+    '''The combo × terminal matrix, with filtering and cached, fixed-width renderings of every cell.
+
+    Column widths are computed once when the results are loaded; each distinct sequence is rendered once per column
+    width, so drawing a screen is only a matter of joining cached strings.
+
+    '''
+    def __init__(self, surveys):
+        super().__init__()
+
+        self.surveys = surveys
+        self.combos = allCombos(surveys)
+        self.comboParts = [splitCombo(combo) for combo in self.combos]
+        self.labels = [terminalLabel(survey['environment']) for survey in surveys]
+        self.systems = [survey['environment'].get('platform system') or '' for survey in surveys]
+
+        self._displayCache = {}
+        self._cellCache = {}
+
+        self.comboWidth = max((len(combo) for combo in self.combos), default=0) + 2
+        self.columnWidths = [
+            min(maxColumnWidth, max(
+                [len(label), len(system), len('none')]
+                + [len(self.displayable(seq)) for seq in survey['results'].values() if seq is not None]
+            ))
+            for survey, label, system in zip(surveys, self.labels, self.systems)
+        ]
+
+        self.modifierFilter = []
+        self.keyFilter = []
+        self.terminalFilter = []
+        self.disagreeingOnly = False
+
+        self.rows = []
+        self.columns = []
+        self.majorities = []
+        self.applyFilters()
+
+    def displayable(self, seq):
+        try:
+            return self._displayCache[seq]
+        except KeyError:
+            display = self._displayCache[seq] = displayableKey(seq)
+            return display
+
+    def cell(self, seq, width, disagrees):
+        cacheKey = (seq, width, disagrees)
+        try:
+            return self._cellCache[cacheKey]
+        except KeyError:
+            pass
+
+        if seq is None:
+            rendered = template('{c.dark.gray}{}{c.reset}').format(_fit('none', width))
+        elif disagrees:
+            rendered = template('{c.bold}{c.red}{}{c.reset}').format(_fit(self.displayable(seq), width))
+        else:
+            rendered = template('{c.userInput}{}{c.reset}').format(_fit(self.displayable(seq), width))
+
+        self._cellCache[cacheKey] = rendered
+        return rendered
+
+    def _rowMatches(self, comboIndex):
+        mods, key = self.comboParts[comboIndex]
+
+        if self.keyFilter and key not in self.keyFilter:
+            return False
+
+        for mod in self.modifierFilter:
+            if mod == 'none' and mods:
+                return False
+            elif mod != 'none' and mod not in mods:
+                return False
+
+        return True
+
+    def _columnMatches(self, surveyIndex):
+        if not self.terminalFilter:
+            return True
+
+        label = self.labels[surveyIndex].lower()
+        return any(term.lower() in label for term in self.terminalFilter)
+
+    def applyFilters(self):
+        self.columns = [index for index in range(len(self.surveys)) if self._columnMatches(index)]
+
+        rows = []
+        majorities = []
+        for index, combo in enumerate(self.combos):
+            if not self._rowMatches(index):
+                continue
+
+            values = [self.surveys[column]['results'].get(combo) for column in self.columns]
+            distinct = len(set(values))
+            if self.disagreeingOnly and distinct <= 1:
+                continue
+
+            rows.append(index)
+            majorities.append(majorityValue(values, noMajority) if distinct > 1 else noMajority)
+
+        self.rows = rows
+        self.majorities = majorities
+
+    def visibleColumns(self, left, width):
+        '''Return the columns (indices into `self.columns`) that fit on screen starting at `left`.
+
+        '''
+        visible = []
+        used = self.comboWidth
+        for position in range(left, len(self.columns)):
+            used += self.columnWidths[self.columns[position]] + 1
+            if used > width and visible:
+                break
+            visible.append(position)
+
+        return visible
+
+    def renderFrame(self, top, left, width, height):
+        '''Return the lines making up the screen, with the window's top-left corner at row `top`, column `left`.
+
+        '''
+        visible = self.visibleColumns(left, width)
+        surveyIndices = [self.columns[position] for position in visible]
+        widths = [self.columnWidths[index] for index in surveyIndices]
+
+        lines = [
+            template('{c.bold}{c.green}{}{c.reset}').format(' ' * self.comboWidth + ' '.join(
+                _fit(self.labels[index], colWidth) for index, colWidth in zip(surveyIndices, widths)
+            )),
+            template('{c.bold}{}{c.reset}').format(' ' * self.comboWidth + ' '.join(
+                _fit(self.systems[index], colWidth) for index, colWidth in zip(surveyIndices, widths)
+            )),
+        ]
+
+        for rowPosition in range(top, min(len(self.rows), top + height - headerRows - footerRows)):
+            combo = self.combos[self.rows[rowPosition]]
+            majority = self.majorities[rowPosition]
+            cells = []
+            for index, colWidth in zip(surveyIndices, widths):
+                seq = self.surveys[index]['results'].get(combo)
+                cells.append(self.cell(seq, colWidth, majority is not noMajority and seq != majority))
+
+            lines.append(template('{c.yellow}{}{c.reset}').format(_fit(combo, self.comboWidth)) + ' '.join(cells))
+
+        while len(lines) < height - footerRows:
+            lines.append('')
+
+        return lines
+
+
+class Browser(object):
+    '''Interactive, scrolling view of a `MatrixView`; only lines that changed since the last frame are redrawn.
+
+    '''
+    def __init__(self, view):
+        super().__init__()
+
+        self.view = view
+        self.top = 0
+        self.left = 0
+        self.lastFrame = []
+        self.lastSize = None
+        self.message = ''
+
+    def statusLine(self, width):
+        filters = []
+        if self.view.modifierFilter:
+            filters.append('mods={}'.format(','.join(self.view.modifierFilter)))
+        if self.view.keyFilter:
+            filters.append('keys={}'.format(','.join(self.view.keyFilter)))
+        if self.view.terminalFilter:
+            filters.append('terms={}'.format(','.join(self.view.terminalFilter)))
+        if self.view.disagreeingOnly:
+            filters.append('disagreeing')
+
+        rowCount = len(self.view.rows)
+        bodyHeight = self.lastSize[1] - headerRows - footerRows
+        status = ' combos {}-{} of {}, terminal {} of {}  {}  {}'.format(
+            min(self.top + 1, rowCount), min(self.top + bodyHeight, rowCount), rowCount,
+            min(self.left + 1, len(self.view.columns)), len(self.view.columns),
+            ' '.join(filters), self.message or '[m]ods [k]eys [t]erms [d]isagreeing [q]uit'
+        )
+
+        return template('{c.inverse}{}{c.reset}').format(_fit(status, width - 1))
+
+    def draw(self):
+        size = shutil.get_terminal_size()
+        if size != self.lastSize:
+            self.lastSize = size
+            self.lastFrame = []
+            console.eraseDisplay(2)
+
+        width, height = size
+        bodyHeight = height - headerRows - footerRows
+        self.top = max(0, min(self.top, len(self.view.rows) - bodyHeight))
+        self.left = max(0, min(self.left, len(self.view.columns) - 1))
+
+        frame = self.view.renderFrame(self.top, self.left, width, height)
+        frame.append(self.statusLine(width))
+
+        output = []
+        for lineNum, line in enumerate(frame):
+            if lineNum < len(self.lastFrame) and self.lastFrame[lineNum] == line:
+                continue
+            output.append(csi(lineNum + 1, 1, flag='H') + line + csi(flag='K'))
+
+        self.lastFrame = frame
+        if output:
+            sys.stdout.write(''.join(output))
+            sys.stdout.flush()
+
+    def readFilter(self, prompt, initial):
+        '''Read a line of text on the status line, without leaving raw mode.
+
+        '''
+        text = ','.join(initial)
+        width, height = self.lastSize
+        self.lastFrame = self.lastFrame[:-1]
+
+        while True:
+            sys.stdout.write(template('{}{c.inverse}{}{}{c.reset}').format(
+                csi(height, 1, flag='H') + csi(flag='K'), prompt, text
+            ))
+            sys.stdout.flush()
+
+            for key in splitSequences(readKey()):
+                if key in (CTRL_C, '\x1b'):
+                    return initial
+                elif key.startswith('\x1b'):
+                    continue
+
+                for char in key:
+                    if char in enterKeys:
+                        return _splitFilter(text)
+                    elif char in backspaceKeys:
+                        text = text[:-1]
+                    elif char.isprintable() and len(prompt) + len(text) < width - 1:
+                        text += char
+
+    def handleKey(self, char):
+        '''Apply a single key; returns False if it was a request to quit.
+
+        '''
+        pageSize = max(1, self.lastSize[1] - headerRows - footerRows)
+
+        if char in ('q', CTRL_C):
+            return False
+        elif char in upKeys:
+            self.top -= 1
+        elif char in downKeys:
+            self.top += 1
+        elif char in leftKeys:
+            self.left -= 1
+        elif char in rightKeys:
+            self.left += 1
+        elif char in pageUpKeys:
+            self.top -= pageSize
+        elif char in pageDownKeys:
+            self.top += pageSize
+        elif char in homeKeys:
+            self.top = self.left = 0
+        elif char in endKeys:
+            self.top = len(self.view.rows)
+        elif char == 'm':
+            self.view.modifierFilter = self.readFilter('Modifiers: ', self.view.modifierFilter)
+            self.view.applyFilters()
+        elif char == 'k':
+            self.view.keyFilter = self.readFilter('Keys: ', self.view.keyFilter)
+            self.view.applyFilters()
+        elif char == 't':
+            self.view.terminalFilter = self.readFilter('Terminals: ', self.view.terminalFilter)
+            self.view.applyFilters()
+        elif char == 'd':
+            self.view.disagreeingOnly = not self.view.disagreeingOnly
+            self.view.applyFilters()
+        else:
+            self.message = 'Unknown key: {}'.format(displayableKey(char))
+
+        return True
+
+    def run(self):
+        try:
+            cursor.hide()
+
+            with rawStdin():
+                while True:
+                    self.draw()
+                    self.message = ''
+
+                    # Held keys (auto-repeat) and fast typing arrive as several keys in one read; apply each of them,
+                    # then redraw once.
+                    if not all(self.handleKey(char) for char in splitSequences(readKey())):
+                        break
+
+        finally:
+            sys.stdout.write(csi(self.lastSize[1] if self.lastSize else 1, 1, flag='H'))
+            cursor.show()
+
+
+def main():
+    args = parser.parse_args()
+
+    files = args.files or defaultResultFiles()
+    if not files:
+        parser.error('no survey result files given, and none found in the current directory')
+
+    view = MatrixView(loadResults(files))
+    view.modifierFilter = _splitFilter(args.modifiers)
+    view.keyFilter = _splitFilter(args.keys)
+    view.terminalFilter = _splitFilter(args.terminals)
+    view.disagreeingOnly = args.disagreeing
+    view.applyFilters()
+
+    Browser(view).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+'''Generate synthetic corpora of survey results from real ones, and benchmark the tools against them.
+
+'''
+# pylint: disable=invalid-name
+
+import argparse
+from collections import OrderedDict
+import glob
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from terminalOutput import template
+from surveyCorpus import CorpusGenerator, writeFiles, writeJSONL
+from surveyModel import SurveyCorpus
+from surveyResults import aggregateResults, allCombos, loadResults
+
+
+defaultSeedFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'term-key-viewer', 'src', 'results.json')
+
+parser = argparse.ArgumentParser(description=__doc__)
+subparsers = parser.add_subparsers(dest='command')
+subparsers.required = True
+
+generateParser = subparsers.add_parser('generate', help='write a synthetic corpus')
+generateParser.add_argument('seeds', metavar='SEED_FILE', nargs='*',
+                            help='real survey files to use as profiles (default: the viewer\'s results.json)')
+generateParser.add_argument('-n', '--count', type=int, default=10000, help='how many surveys to generate')
+generateParser.add_argument('-s', '--seed', type=int, default=0,
+                            help='random seed; the same seed always gives the same corpus')
+generateParser.add_argument('-o', '--output', metavar='PATH', required=True,
+                            help='a .jsonl file to write (one survey per line), or a directory to write one file per '
+                            'survey into')
+
+benchmarkParser = subparsers.add_parser('benchmark', help='time loading, aggregating and rendering a corpus')
+benchmarkParser.add_argument('corpus', metavar='PATH', nargs='+',
+                             help='corpus files (.jsonl or .json), or directories of survey files')
+benchmarkParser.add_argument('--no-memory', action='store_true',
+                             help="don't trace memory allocations (tracing makes every stage slower)")
+benchmarkParser.add_argument('-o', '--output', metavar='FILE', help='where to write the measurements (default: stdout)')
+
+
+def _loadBrowser():
+    # The browser is a script rather than a module (its name has a hyphen in it), so load it from its path.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'term-key-browser.py')
+    spec = importlib.util.spec_from_file_location('termKeyBrowser', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _corpusFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.json'))))
+        else:
+            files.append(path)
+
+    return files
+
+
+class StageTimer(object):
+    '''Measure the time taken and (optionally) the peak memory allocated by each stage of the benchmark.
+
+    '''
+    def __init__(self, traceMemory=True):
+        super().__init__()
+
+        self.traceMemory = traceMemory
+        self.stages = OrderedDict()
+
+    def run(self, name, func, *args):
+        print(template('{c.bold}{}{c.reset}...').format(name), end=' ', file=sys.stderr, flush=True)
+
+        if self.traceMemory:
+            tracemalloc.start()
+        startTime = time.perf_counter()
+
+        result = func(*args)
+
+        elapsed = time.perf_counter() - startTime
+        stats = OrderedDict((('seconds', round(elapsed, 4)),))
+        if self.traceMemory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats['peak MB'] = round(peak / 1e6, 2)
+            stats['retained MB'] = round(current / 1e6, 2)
+
+        self.stages[name] = stats
+        print(', '.join('{} {}'.format(value, unit) for unit, value in stats.items()), file=sys.stderr)
+        return result
+
+
+def _serializedLength(data):
+    return len(json.dumps(data, separators=(',', ':')))
+
+
+def _renderPages(view, width=200, height=50, pages=10):
+    frames = 0
+    bodyHeight = height - 3
+    for page in range(pages):
+        top = max(0, len(view.rows) - bodyHeight) * page // max(1, pages - 1)
+        for left in (0, len(view.columns) // 2):
+            view.renderFrame(top, left, width, height)
+            frames += 1
+
+    return frames
+
+
+def generate(args):
+    profiles = loadResults(args.seeds or [defaultSeedFile])
+    generator = CorpusGenerator(profiles, seed=args.seed)
+
+    startTime = time.perf_counter()
+    if args.output.endswith('.jsonl'):
+        written = writeJSONL(generator.generate(args.count), args.output)
+    else:
+        written = writeFiles(generator.generate(args.count), args.output)
+
+    print(template('Wrote {} surveys from {} profiles to {c.cyan}{}{c.reset} in {:.1f}s').format(
+        written, len(profiles), args.output, time.perf_counter() - startTime
+    ))
+
+
+def benchmark(args):
+    timer = StageTimer(traceMemory=not args.no_memory)
+    browser = _loadBrowser()
+
+    files = _corpusFiles(args.corpus)
+    # Keep the model until the stage has been measured, so that its retained size is what it actually holds on to.
+    model = timer.run('load model', SurveyCorpus.load, files)
+    del model
+    surveys = timer.run('load', loadResults, files)
+    combos = timer.run('combos', allCombos, surveys)
+    aggregated = timer.run('aggregate', aggregateResults, surveys)
+    timer.run('serialize', _serializedLength, aggregated)
+    del aggregated
+    view = timer.run('matrix', browser.MatrixView, surveys)
+    frames = timer.run('render', _renderPages, view)
+
+    report = OrderedDict((
+        ('corpus', OrderedDict((
+            ('files', len(files)),
+            ('bytes', sum(os.path.getsize(path) for path in files)),
+            ('surveys', len(surveys)),
+            ('combos', len(combos)),
+            ('frames rendered', frames),
+        ))),
+        ('memory traced', timer.traceMemory),
+        ('stages', timer.stages),
+    ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate(args)
+    else:
+        benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
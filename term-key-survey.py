@@ -11,10 +11,16 @@ import os
 import platform
 import sys
 
-from terminalOutput import colors, promptColors
-from terminalInput import BackException, QuitException, MenuChoice, chooseOne, displayableKey, getKey, \
-        queryBasicKeys, rawStdin, readByte, readLine, yesNo
+from terminalOutput import colorLevels, colors, setColorLevel, template
+from terminalInput import BackException, QuitException, MenuChoice, chooseOne, detectCursorPositionReport, \
+        displayableKey, getKey, getKeyGroup, queryBasicKeys, rawStdin, readByte, readLine, yesNo
 import terminalInput
+import instrumentation
+from surveyResults import loadResults, splitCombo
+import outputBenchmark
+import terminalEvents
+import autoRepeat
+from fingerprint import FingerprintTree
 
 
 #DEFAULT_KEYS = 'F12 Delete Backspace'.split()
@@ -22,6 +28,16 @@ import terminalInput
 #DEFAULT_KEYS = 'Up Down'.split()
 DEFAULT_KEYS = 'Left Right Up Down Delete Backspace Home End PgUp PgDn F12'.split()
 
+defaultCorpus = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'term-key-viewer', 'src', 'results.json')
+
+
+def positiveInt(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, not {}'.format(value))
+
+    return value
+
 
 parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument('terminal_name', metavar='TERMINAL_NAME', nargs='?', help='the name of the terminal being tested',
@@ -29,9 +45,131 @@ parser.add_argument('terminal_name', metavar='TERMINAL_NAME', nargs='?', help='t
 parser.add_argument('-k', '--keys', metavar='KEY', nargs=1, help='the names of keys to test', default=DEFAULT_KEYS)
 parser.add_argument('-m', '--modifiers', metavar='MOD', nargs=1, help='the modifier keys to test')
 parser.add_argument('-y', '--yes', dest='yesToAll', action='store_true', help='answer "yes" to all yes/no questions')
+parser.add_argument('-b', '--baseline', metavar='FILE', action='append', default=[],
+                    help='the results of a previous session to compare against; only combos that are new, were '
+                    'skipped, or have changed need to be pressed (may be given more than once; later files win)')
+parser.add_argument('--batch-size', metavar='COUNT', type=positiveInt, default=10,
+                    help='how many unchanged combos from the baseline to confirm at once')
+parser.add_argument('-g', '--group-size', metavar='COUNT', type=positiveInt, default=1,
+                    help='ask for up to COUNT combos with the same modifiers at once, pressed one after another')
+parser.add_argument('--cpr', action='store_true',
+                    help='find the end of each key by asking for a cursor position report, instead of waiting for a '
+                    'pause (falls back to waiting if the terminal does not answer)')
+parser.add_argument('--benchmark-output', metavar='WORKLOAD', nargs='*', choices=list(outputBenchmark.workloads),
+                    help='after the keys, measure how fast the terminal renders each of the given kinds of output '
+                    '(default: all of {})'.format(', '.join(outputBenchmark.workloads)))
+parser.add_argument('--benchmark-duration', metavar='SECONDS', type=float, default=2.0,
+                    help='how long to run each output benchmark for')
+parser.add_argument('--events', metavar='SECTION', nargs='*', choices=list(terminalEvents.sections),
+                    help='after the keys, record the mouse, focus and bracketed-paste reports the terminal sends in '
+                    'each of the given sections (default: all of {})'.format(', '.join(terminalEvents.sections)))
+parser.add_argument('--event-duration', metavar='SECONDS', type=float, default=5.0,
+                    help='how long to record each event section for, after its first event')
+parser.add_argument('-r', '--repeat', metavar='COMBO', nargs='*',
+                    help='after the keys, measure the auto-repeat delay, rate and jitter of each of the given combos '
+                    'while you hold it down (default: {})'.format(', '.join(autoRepeat.defaultCombos)))
+parser.add_argument('--repeat-duration', metavar='SECONDS', type=float, default=3.0,
+                    help='how long to hold each combo for when measuring auto-repeat')
+parser.add_argument('-f', '--fingerprint', metavar='CORPUS', nargs='*',
+                    help='instead of a full survey, identify the terminal by asking for as few keys as possible, '
+                    'based on the surveys in the given files (default: the results bundled with term-key-viewer)')
+parser.add_argument('--color-level', choices=colorLevels,
+                    help='which colors to use in output (default: guessed from TERM, COLORTERM and NO_COLOR)')
+parser.add_argument('-p', '--profile', metavar='FILE', nargs='?', const='',
+                    help='count reads, writes, flushes and time spent per prompt, and write the counts to FILE (or '
+                    'into the results, if no FILE is given)')
 
 args = parser.parse_args()
 
+if args.fingerprint is not None and args.profile == '':
+    parser.error('--fingerprint writes no results to put the profile into; give --profile a FILE')
+
+if args.color_level:
+    setColorLevel(args.color_level)
+
+if args.profile is not None:
+    instrumentation.enable()
+
+if args.cpr and detectCursorPositionReport() is None:
+    colors.printWarning(
+        "This terminal doesn't answer cursor position queries; keys will be separated by pauses instead.",
+        file=sys.stdout
+    )
+
+
+def _writeProfile():
+    print(template('Writing profile to {c.cyan}{}{c.reset} ...').format(args.profile))
+    with open(args.profile, 'w') as f:
+        json.dump(instrumentation.report(), f, indent=4)
+
+
+def _fingerprint(corpusFiles):
+    print('Loading fingerprints...')
+    tree = FingerprintTree.load(corpusFiles)
+
+    path = [tree.root]
+    answers = OrderedDict()
+    with rawStdin():
+        while 'branches' in path[-1]:
+            node = path[-1]
+            instrumentation.beginPrompt(node['combo'])
+
+            try:
+                response = getKey(
+                    template('{c.dark.gray}[{}]{c.reset} Please press {c.bold}{c.yellow}{}{c.reset}... ')
+                    .format(len(path), node['combo']),
+                    allowSkip=True
+                )
+            except QuitException:
+                print(template('\r\n{c.dark.gray}Exiting.{c.reset}\r').format())
+                sys.exit(1)
+            except BackException:
+                print(template('\r\n{c.dark.gray}Repeating previous question.{c.reset}\r').format())
+                if len(path) > 1:
+                    path.pop()
+                    answers.popitem()
+                continue
+
+            child = tree.child(node, response)
+            if child is None:
+                break
+
+            answers[node['combo']] = response
+            path.append(child)
+
+    matches = path[-1]['matches']
+    if 'branches' in path[-1]:
+        colors.printWarning('No surveyed terminal sends that for {}; showing the closest matches.'
+                            .format(path[-1]['combo']), file=sys.stdout)
+
+    matchCount = sum(match['surveys'] for match in matches.values())
+    print()
+    colors.printHeading('Matches ({} keys pressed):'.format(len(answers)))
+    for program, match in matches.items():
+        print(template(' {c.bold}{c.green}{}{c.reset} {} {c.dark.gray}({} of {} matching surveys){c.reset}').format(
+            program, match['versions'] or '(unknown version)', match['surveys'], matchCount
+        ))
+
+    predicted = tree.predictedResults(path)
+    comboColWidth = max(len(combo) for combo in predicted) + 2
+
+    print()
+    colors.printHeading('Predicted results:')
+    predictedRow = template(' {c.yellow}{combo: <{comboColWidth}}{c.reset} {c.userInput}{val}{c.reset}{pressed}')
+    for combo, seq in predicted.items():
+        print(predictedRow.format(
+            combo=combo, comboColWidth=comboColWidth, val=displayableKey(seq),
+            pressed=template(' {c.dark.gray}(pressed){c.reset}').format() if combo in answers else ''
+        ))
+
+
+if args.fingerprint is not None:
+    _fingerprint(args.fingerprint or [defaultCorpus])
+    if args.profile:
+        print()
+        _writeProfile()
+    sys.exit(0)
+
 
 queryBasicKeys()
 
@@ -55,8 +193,8 @@ else:
     ))
 
     def _displayKeyboard(name, mods):
-        return '{c.bold}{}{c.reset} {}' \
-                .format(name, '({})'.format(', '.join(mods)) if isinstance(mods, list) else '', c=colors)
+        return template('{c.bold}{}{c.reset} {}') \
+                .format(name, '({})'.format(', '.join(mods)) if isinstance(mods, list) else '')
 
     keyboardChoice = chooseOne(
         'Please choose your keyboard:',
@@ -68,19 +206,20 @@ if modifiers is None:
     modifiers = []
     print()
     colors.printHeading('Please enter the names of the modifier keys on your keyboard, one per line:')
-    print('''
+    print(template('''
 (please use {c.yellow}Ctrl{c.reset} in place of {c.yellow}Control{c.reset}, and {c.yellow}Alt{c.reset} in place of
 {c.yellow}Option{c.reset}, to maintain consistency across different keyboards)
 
 Press {c.yellow}Enter{c.reset} to accept each modifier, and {c.yellow}Enter{c.reset} again on a blank entry when you are finished.
-'''.format(c=colors))  # noqa: E501
+''').format())  # noqa: E501
 
+    instrumentation.beginPrompt('modifiers')
     modNum = 1
-    entry = readLine('{c.bold}Modifier {}:{c.reset} '.format(modNum, c=promptColors))
+    entry = readLine(template('{c.bold}Modifier {}:{c.reset} ', prompt=True).format(modNum))
     while entry != '':
         modifiers.append(entry)
         modNum += 1
-        entry = readLine('{c.bold}Modifier {}:{c.reset} '.format(modNum, c=promptColors))
+        entry = readLine(template('{c.bold}Modifier {}:{c.reset} ', prompt=True).format(modNum))
 
 system = platform.system()
 
@@ -125,9 +264,9 @@ envKeyWidth = max(len(envKey) for envKey in env) + 2
 
 def _envItemDisplay(envKey, value):
     return (
-        '{c.bold}{: <{}}{c.reset} {c.green}{}{c.reset}'.format(envKey + ':', envKeyWidth, value, c=colors)
+        template('{c.bold}{: <{}}{c.reset} {c.green}{}{c.reset}').format(envKey + ':', envKeyWidth, value)
         if value is not None else
-        '{c.bold}{: <{}}{c.reset} {c.dark.gray}{}{c.reset}'.format(envKey + ':', envKeyWidth, value, c=colors)
+        template('{c.bold}{: <{}}{c.reset} {c.dark.gray}{}{c.reset}').format(envKey + ':', envKeyWidth, value)
     )
 
 
@@ -137,14 +276,15 @@ def _printEnvironment():
 
 
 def _confirmEnvironment():
+    instrumentation.beginPrompt('environment')
     print()
     _printEnvironment()
 
     if args.yesToAll:
         return True
 
-    sys.stdout.write('''
-{c.bold}Does this look correct?{c.reset} {c.dark.gray}[Y/n]{c.reset} '''.format(c=colors))
+    sys.stdout.write(template('''
+{c.bold}Does this look correct?{c.reset} {c.dark.gray}[Y/n]{c.reset} ''').format())
 
     return yesNo(True)
 
@@ -157,19 +297,19 @@ while not _confirmEnvironment():
     envItemChoice = chooseOne(
         'Choose an item to edit:',
         [MenuChoice(_envItemDisplay(key, value), key=key) for key, value in env.items()]
-        + [MenuChoice('{c.bold}Done{c.reset}'.format(c=colors), key=None)]
+        + [MenuChoice(template('{c.bold}Done{c.reset}').format(), key=None)]
     )
 
     while envItemChoice.key is not None:
         env[envItemChoice.key] = readLine(
-            '{c.bold}{}:{c.reset} '.format(envItemChoice.key, c=promptColors),
+            template('{c.bold}{}:{c.reset} ', prompt=True).format(envItemChoice.key),
             initialText=env[envItemChoice.key]
         )
 
         envItemChoice = chooseOne(
             'Choose an item to edit:',
             [MenuChoice(_envItemDisplay(key, value), key=key) for key, value in env.items()]
-            + [MenuChoice('{c.bold}Done{c.reset}'.format(c=colors), key=None)]
+            + [MenuChoice(template('{c.bold}Done{c.reset}').format(), key=None)]
         )
 
     print()
@@ -194,17 +334,160 @@ responses = {
 # Filter out 'Up', 'Down', 'Enter', and 'Esc' without modifiers, since we already asked for them at the beginning.
 combosToQuery = [combo for combo in combos if combo not in ('Up', 'Down', 'Enter', 'Esc')]
 
+# The expected sequence for each combo, from the baseline files (later files win); `None` means the combo was skipped
+# last time.
+baseline = {}
+for baselineSurvey in loadResults(args.baseline):
+    baseline.update(baselineSurvey['results'])
+
+
+def _confirmBaseline(combosToConfirm):
+    '''Offer the baseline sequences of `combosToConfirm` for confirmation in batches; return the combos that still need
+    to be pressed.
+
+    '''
+    unconfirmed = []
+    comboWidth = max((len(combo) for combo in combosToConfirm), default=0) + 2
+
+    for start in range(0, len(combosToConfirm), args.batch_size):
+        batch = combosToConfirm[start:start + args.batch_size]
+        instrumentation.beginPrompt('baseline')
+
+        print()
+        colors.printHeading('Sequences from the baseline ({}-{} of {}):'
+                            .format(start + 1, start + len(batch), len(combosToConfirm)))
+        for combo in batch:
+            print(
+                template(' {c.yellow}{combo: <{comboWidth}}{c.reset} {c.userInput}{val}{c.reset}')
+                .format(combo=combo, comboWidth=comboWidth, val=displayableKey(baseline[combo]))
+            )
+
+        if args.yesToAll:
+            accepted = True
+        else:
+            sys.stdout.write(template('''
+{c.bold}Are these all unchanged?{c.reset} {c.dark.gray}[Y/n]{c.reset} ''').format())
+            accepted = yesNo(True)
+
+        if accepted:
+            for combo in batch:
+                responses[combo] = baseline[combo]
+        else:
+            unconfirmed.extend(batch)
+
+    return unconfirmed
+
+
+if baseline:
+    combosToQuery = _confirmBaseline([combo for combo in combosToQuery if baseline.get(combo) is not None]) \
+        + [combo for combo in combosToQuery if baseline.get(combo) is None]
+
 
 def _getKeyAtIndex(index):
     keyName = combosToQuery[index]
+    expected = baseline.get(keyName)
+    instrumentation.beginPrompt(keyName)
+
+    prompt = template('{c.dark.gray}[{}/{}]{c.reset} Please press {c.bold}{c.yellow}{}{c.reset}... ') \
+        .format(index + 1, len(combosToQuery), keyName)
+    if expected is not None:
+        prompt += template('{c.dark.gray}(expecting {}){c.reset} ').format(displayableKey(expected))
+
+    response = getKey(prompt, allowSkip=True)
+    while expected is not None and response != expected and not args.yesToAll:
+        sys.stdout.write(template(
+            '{c.warning}Changed from the baseline!{c.reset} {c.bold}Keep the new sequence?{c.reset} '
+            '{c.dark.gray}[Y/n]{c.reset} '
+        ).format())
+        if yesNo(True):
+            sys.stdout.write('\r')
+            break
+
+        sys.stdout.write('\r')
+        response = getKey(prompt, allowSkip=True)
+
+    responses[keyName] = response
+
+
+def _groupCombos(combosToGroup, size):
+    '''Split `combosToGroup` into groups of at most `size` combos sharing the same modifiers.
+
+    '''
+    byModifiers = OrderedDict()
+    for combo in combosToGroup:
+        byModifiers.setdefault(splitCombo(combo)[0], []).append(combo)
+
+    return [
+        sameMods[start:start + size]
+        for sameMods in byModifiers.values()
+        for start in range(0, len(sameMods), size)
+    ]
+
 
-    responses[keyName] = getKey(
-        '{c.dark.gray}[{}/{}]{c.reset} Please press {c.bold}{c.yellow}{}{c.reset}... '
-        .format(index + 1, len(combosToQuery), keyName, c=colors), allowSkip=True
+comboGroups = _groupCombos(combosToQuery, args.group_size)
+
+
+def _getGroupAtIndex(index):
+    group = comboGroups[index]
+    instrumentation.beginPrompt(', '.join(group))
+
+    prompt = template('{c.dark.gray}[{}/{}]{c.reset} Please press, in order: {}... ').format(
+        index + 1, len(comboGroups),
+        ', '.join(template('{c.bold}{c.yellow}{}{c.reset}').format(combo) for combo in group)
     )
+    comboWidth = max(len(combo) for combo in group) + 2
+
+    while True:
+        sequences = getKeyGroup(prompt, len(group))
+
+        for combo, seq in zip(group, sequences):
+            expected = baseline.get(combo)
+            sys.stdout.write(
+                template('   {c.yellow}{combo: <{comboWidth}}{c.reset} {c.userInput}{val}{c.reset}')
+                .format(combo=combo, comboWidth=comboWidth, val=displayableKey(seq))
+                if seq is not None else
+                template('   {c.yellow}{combo: <{comboWidth}}{c.reset} {c.dark.gray}(skipped){c.reset}')
+                .format(combo=combo, comboWidth=comboWidth)
+            )
+            if expected is not None and seq != expected:
+                sys.stdout.write(
+                    template(' {c.warning}(baseline: {}){c.reset}').format(displayableKey(expected))
+                )
+            sys.stdout.write('\r\n')
+
+        if args.yesToAll:
+            break
+
+        sys.stdout.write(template('{c.bold}Is this correct?{c.reset} {c.dark.gray}[Y/n]{c.reset} ').format())
+        if yesNo(True):
+            sys.stdout.write('\r')
+            break
+        sys.stdout.write('\r')
+
+    for combo, seq in zip(group, sequences):
+        responses[combo] = seq
+
+
+def _askAll(count, askAtIndex):
+    with rawStdin():
+        i = 0
+        while i < count:
+            try:
+                askAtIndex(i)
 
+            except QuitException:
+                print(template('\r\n{c.dark.gray}Exiting.{c.reset}\r').format())
+                sys.exit(1)
 
-print('''
+            except BackException:
+                print(template('\r\n{c.dark.gray}Repeating previous question.{c.reset}\r').format())
+                i = max(0, i - 1)
+                continue
+
+            i += 1
+
+
+print(template('''
 
 Testing keys: {keys}
 Testing modifiers: {modifiers}
@@ -214,58 +497,145 @@ Special keys:
   {c.bold}{c.cyan}q{c.reset}      - {c.bold}Quit{c.reset}
   {c.bold}{c.cyan}b{c.reset}      - {c.bold}Back{c.reset} (redo previous question; useful if you pressed the wrong keys)
   {c.bold}{c.cyan}Space{c.reset}  - {c.bold}Skip{c.reset} question (useful if your terminal doesn't respond to a given key)
-'''.format(  # noqa: E501
-    keys=', '.join('{c.bold}{c.yellow}{key}{c.reset}'.format(key=key, c=colors) for key in args.keys),
-    modifiers=', '.join('{c.bold}{c.yellow}{mod}{c.reset}'.format(mod=mod, c=colors) for mod in modifiers),
-    c=colors
+{groupHelp}''').format(  # noqa: E501
+    keys=', '.join(template('{c.bold}{c.yellow}{key}{c.reset}').format(key=key) for key in args.keys),
+    modifiers=', '.join(template('{c.bold}{c.yellow}{mod}{c.reset}').format(mod=mod) for mod in modifiers),
+    groupHelp=template('''
+When asked for several keys at once, {c.bold}b{c.reset}, {c.bold}q{c.reset} and {c.bold}Space{c.reset} apply to the \
+whole group if pressed first; after that, {c.bold}Space{c.reset} skips only the key at that position.
+''').format() if args.group_size > 1 else ''
 ))
 
-with rawStdin():
-    i = 0
-    while i < len(combosToQuery):
-        try:
-            _getKeyAtIndex(i)
-
-        except QuitException:
-            print('\r\n{c.dark.gray}Exiting.{c.reset}\r'.format(c=colors))
-            sys.exit(1)
-
-        except BackException:
-            print('\r\n{c.dark.gray}Repeating previous question.{c.reset}\r'.format(c=colors))
-            i -= 1
-            continue
+if args.group_size > 1:
+    _askAll(len(comboGroups), _getGroupAtIndex)
+else:
+    _askAll(len(combosToQuery), _getKeyAtIndex)
 
-        i += 1
 
+outputResults = None
+if args.benchmark_output is not None:
+    instrumentation.beginPrompt('output benchmark')
+    print('Measuring output speed...')
+    outputResults = outputBenchmark.runBenchmarks(args.benchmark_output, args.benchmark_duration)
+
+repeatResults = None
+if args.repeat is not None:
+    instrumentation.beginPrompt('auto-repeat')
+    print()
+    colors.printHeading('Auto-repeat:')
+    try:
+        repeatResults = autoRepeat.runRepeatSurvey(args.repeat, args.repeat_duration)
+    except QuitException:
+        print(template('\r\n{c.dark.gray}Exiting.{c.reset}\r').format())
+        sys.exit(1)
+
+eventResults = None
+if args.events is not None:
+    instrumentation.beginPrompt('events')
+    print()
+    colors.printHeading('Mouse, focus and paste reports:')
+    eventResults = terminalEvents.runEventSurvey(args.events, args.event_duration)
+
+instrumentation.beginPrompt('results')
 
 comboColWidth = max(len(combo) for combo in combos) + max(len(mod) for mod in modifiers) + 3
 
+print()
 _printEnvironment()
 print()
 colors.printHeading('Results:')
 print(
-    ' {c.bold}{c.green}{combo: <{comboColWidth}} {val}{c.reset}'
-    .format(combo='Key Combination', comboColWidth=comboColWidth, val='Byte sequence', c=colors)
+    template(' {c.bold}{c.green}{combo: <{comboColWidth}} {val}{c.reset}')
+    .format(combo='Key Combination', comboColWidth=comboColWidth, val='Byte sequence')
 )
+resultRow = template(' {c.yellow}{combo: <{comboColWidth}}{c.reset} {c.userInput}{val}{c.reset}')
 for combo in combos:
-    val = displayableKey(responses[combo])
+    print(resultRow.format(combo=combo, comboColWidth=comboColWidth, val=displayableKey(responses[combo])))
+
+if outputResults is not None:
+    workloadColWidth = max(len(name) for name in outputResults) + 2
+
+    print()
+    colors.printHeading('Output speed:')
+    print(
+        template(' {c.bold}{c.green}{: <{}} {: >10} {: >10}{c.reset}')
+        .format('Workload', workloadColWidth, 'MB/s', 'frames/s')
+    )
+    for name, stats in outputResults.items():
+        print(
+            template(' {c.yellow}{: <{}}{c.reset} {: >10} {: >10}{}').format(
+                name, workloadColWidth, stats['MB/s'], stats['frames/s'],
+                '' if stats['synced'] else template(' {c.dark.gray}(not synced){c.reset}').format()
+            )
+        )
+
+if repeatResults is not None:
+    repeatColWidth = max(len(combo) for combo in repeatResults) + 2
+
+    print()
+    colors.printHeading('Auto-repeat:')
     print(
-        ' {c.yellow}{combo: <{comboColWidth}}{c.reset} {c.userInput}{val}{c.reset}'
-        .format(combo=combo, comboColWidth=comboColWidth, val=val, c=colors)
+        template(' {c.bold}{c.green}{: <{}} {: >10} {: >8} {: >10} {: >10}{c.reset}')
+        .format('Key Combination', repeatColWidth, 'delay ms', 'rate /s', 'jitter ms', 'coalesced')
     )
+    repeatRow = template(' {c.yellow}{: <{}}{c.reset} {: >10} {: >8} {: >10} {: >10}')
+    for repeatCombo, stats in repeatResults.items():
+        if stats is None:
+            print(template(' {c.yellow}{: <{}}{c.reset} {c.dark.gray}(skipped){c.reset}').format(
+                repeatCombo, repeatColWidth
+            ))
+            continue
+
+        print(repeatRow.format(
+            repeatCombo, repeatColWidth, str(stats['delay ms']), str(stats['rate /s']), str(stats['jitter ms']),
+            '{}/{}'.format(stats['coalesced reads'], stats['reads'])
+        ))
+
+if eventResults is not None:
+    sectionColWidth = max(len(name) for name in eventResults) + 2
+
+    print()
+    colors.printHeading('Reports:')
+    for name, summary in eventResults.items():
+        if summary is None:
+            description = template('{c.dark.gray}(none){c.reset}').format()
+        elif 'encodings' in summary:
+            description = '{} encoding, {} reports/s (peak {})'.format(
+                '/'.join(summary['encodings']), summary['reports/s'], summary['peak reports/s']
+            )
+        elif 'focus in' in summary:
+            description = '{} in, {} out'.format(summary['focus in'], summary['focus out'])
+        elif summary['bracketed']:
+            description = '{} bytes in {} pastes, {} MB/s'.format(sum(summary['bytes']), summary['pastes'],
+                                                                   summary['MB/s'])
+        else:
+            description = template('{c.warning}not bracketed{c.reset}').format()
+
+        print(template(' {c.yellow}{: <{}}{c.reset} {}').format(name, sectionColWidth, description))
 
 outObject = {
     'environment': env,
     'results': responses,
 }
+if outputResults is not None:
+    outObject['output benchmark'] = outputResults
+if repeatResults is not None:
+    outObject['auto-repeat'] = repeatResults
+if eventResults is not None:
+    outObject['events'] = eventResults
+if args.profile == '':
+    outObject['profile'] = instrumentation.report()
 outFilename = 'term-key-survey-{}-{}-{}-{}.json' \
         .format(env['terminal program'], env['terminal version'], env['platform system'], env['platform release'])
 print()
-print('Writing results to {c.cyan}{}{c.reset} ...'.format(outFilename, c=colors))
+print(template('Writing results to {c.cyan}{}{c.reset} ...').format(outFilename))
 with open(outFilename, 'w') as f:
     json.dump(outObject, f, indent=4)  # Pretty-printed
     #json.dump(outObject, f, separators=(',', ':'))  # Compact representation
 
+if args.profile:
+    _writeProfile()
+
 print()
 print('Please press any key to exit...')
 with rawStdin():
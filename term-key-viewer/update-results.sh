@@ -2,4 +2,4 @@
 
 SCRIPT_PATH=$(dirname "$(realpath "$0")")
 
-jq -s . "$SCRIPT_PATH/../"term-key-survey-*.json > "$SCRIPT_PATH/src/results.json"
+python3 "$SCRIPT_PATH/../term-key-aggregate.py" "$SCRIPT_PATH/../"term-key-survey-*.json -o "$SCRIPT_PATH/src/results.json"
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+'''Measure the latency added by a chain of pty relays and terminal multiplexers, and check whether they rewrite or
+split key sequences on the way through.
+
+'''
+# pylint: disable=invalid-name
+
+import argparse
+from collections import OrderedDict
+import fcntl
+import json
+import math
+import os
+import pty
+import select
+import shlex
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+from terminalOutput import colors, template
+from terminalInput import CTRL_D, displayableKey, rawStdin, readByte
+import terminalInput
+
+
+# Commands used to wrap the next hop of the chain in each kind of layer. `{cmd}` is replaced by the (shell-quoted)
+# command line of the next hop; `None` means the next hop runs directly in the pty of the previous one.
+layerPresets = OrderedDict((
+    ('pty', None),
+    ('tmux', 'tmux -L term-layer-profile -f /dev/null new-session {cmd}'),
+    ('screen', 'screen -q sh -c {cmd}'),
+    ('ssh', 'ssh -tt -o BatchMode=yes localhost {cmd}'),
+    ('mosh', 'mosh localhost -- sh -c {cmd}'),
+))
+
+xtermModifiers = OrderedDict((
+    ('Shift', 2),
+    ('Alt', 3),
+    ('Ctrl', 5),
+))
+
+xtermKeys = OrderedDict((
+    ('Left', ('\x1b[D', '\x1b[1;{}D')),
+    ('Right', ('\x1b[C', '\x1b[1;{}C')),
+    ('Up', ('\x1b[A', '\x1b[1;{}A')),
+    ('Down', ('\x1b[B', '\x1b[1;{}B')),
+    ('Home', ('\x1b[H', '\x1b[1;{}H')),
+    ('End', ('\x1b[F', '\x1b[1;{}F')),
+    ('Delete', ('\x1b[3~', '\x1b[3;{}~')),
+    ('PgUp', ('\x1b[5~', '\x1b[5;{}~')),
+    ('PgDn', ('\x1b[6~', '\x1b[6;{}~')),
+    ('F12', ('\x1b[24~', '\x1b[24;{}~')),
+))
+
+readyTimeout = 30
+keyTimeout = 2
+exitTimeout = 5
+pollInterval = 0.01
+logBufferSize = 65536
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('-l', '--layer', metavar='LAYER', dest='layers', action='append',
+                    help='add a layer to the chain; either one of {} or a shell command containing `{{cmd}}`; may be '
+                    'given multiple times (outermost first)'.format(', '.join(layerPresets)))
+parser.add_argument('-s', '--survey', metavar='FILE',
+                    help='take the synthetic key sequences from the results of a previous term-key-survey.py session')
+parser.add_argument('-n', '--repeat', metavar='COUNT', type=int, default=5, help='how many times to send each key')
+parser.add_argument('-t', '--term', metavar='TERM', default=os.getenv('TERM') or 'xterm-256color',
+                    help='the TERM variable to present to the outermost layer')
+parser.add_argument('-o', '--output', metavar='FILE', help='where to write the JSON results')
+parser.add_argument('--hop', type=int, help=argparse.SUPPRESS)
+parser.add_argument('--reader', action='store_true', help=argparse.SUPPRESS)
+parser.add_argument('--log-dir', help=argparse.SUPPRESS)
+
+
+def _now():
+    return time.monotonic()
+
+
+def _hopLogPath(logDir, hop):
+    return os.path.join(logDir, 'hop-{}.jsonl'.format(hop))
+
+
+def _readerLogPath(logDir):
+    return os.path.join(logDir, 'reader.jsonl')
+
+
+def _openLog(path):
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+
+def _writeLog(logFD, **record):
+    os.write(logFD, (json.dumps(record) + '\n').encode('utf-8'))
+
+
+def _readLog(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.endswith('\n')]
+    except FileNotFoundError:
+        return []
+
+
+class _LogFollower(object):
+    '''Keeps the records of a log that is still being written, reading only what was appended since the last update.
+
+    '''
+    def __init__(self, path):
+        super().__init__()
+
+        self.path = path
+        self.offset = 0
+        self.records = []
+
+    def update(self):
+        '''Read any new complete records, and return all the records so far.
+
+        '''
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return self.records
+
+        # A record that's still being written is left for the next update.
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        self.records.extend(json.loads(line) for line in data[:end].decode('utf-8').splitlines())
+        return self.records
+
+
+def _hopCommand(hop, layers, logDir):
+    args = [sys.executable, os.path.abspath(__file__), '--hop', str(hop), '--log-dir', logDir]
+    for layer in layers:
+        args.extend(('--layer', layer))
+
+    return ' '.join(shlex.quote(arg) for arg in args)
+
+
+def _readerCommand(logDir):
+    return ' '.join(shlex.quote(arg) for arg in (
+        sys.executable, os.path.abspath(__file__), '--reader', '--log-dir', logDir
+    ))
+
+
+def _layerCommand(layer, innerCommand):
+    commandTemplate = layerPresets.get(layer, layer)
+    if commandTemplate is None:
+        return innerCommand
+
+    return commandTemplate.format(cmd=shlex.quote(innerCommand))
+
+
+def _copyWindowSize(fromFD, toFD):
+    try:
+        size = fcntl.ioctl(fromFD, termios.TIOCGWINSZ, b'\0' * 8)
+    except OSError:
+        size = struct.pack('HHHH', 24, 80, 0, 0)
+    fcntl.ioctl(toFD, termios.TIOCSWINSZ, size)
+
+
+def _spawn(command, term=None):
+    pid, masterFD = pty.fork()
+    if pid == 0:
+        if term is not None:
+            os.environ['TERM'] = term
+        os.execvp('sh', ['sh', '-c', command])
+
+    return pid, masterFD
+
+
+def _drain(fd, timeout=0):
+    '''Read and discard whatever output is waiting on `fd`; return False once it has been closed.
+
+    '''
+    while select.select([fd], [], [], timeout)[0]:
+        try:
+            if not os.read(fd, logBufferSize):
+                return False
+        except OSError:
+            return False
+        timeout = 0
+
+    return True
+
+
+def runRelay(hop, layers, logDir):
+    '''Forward stdin to a new pty running the next hop, logging every chunk of input as it arrives.
+
+    '''
+    if hop < len(layers):
+        command = _layerCommand(layers[hop], _hopCommand(hop + 1, layers, logDir))
+    else:
+        command = _readerCommand(logDir)
+
+    logFD = _openLog(_hopLogPath(logDir, hop))
+    stdinFD = sys.stdin.fileno()
+    stdoutFD = sys.stdout.fileno()
+
+    pid, masterFD = _spawn(command)
+    _copyWindowSize(stdinFD, masterFD)
+
+    with rawStdin():
+        try:
+            while True:
+                readable = select.select([stdinFD, masterFD], [], [])[0]
+
+                if stdinFD in readable:
+                    try:
+                        data = os.read(stdinFD, logBufferSize)
+                    except OSError:
+                        break
+                    if not data:
+                        break
+                    _writeLog(logFD, t=_now(), data=data.decode('latin-1'))
+                    os.write(masterFD, data)
+
+                if masterFD in readable:
+                    try:
+                        data = os.read(masterFD, logBufferSize)
+                    except OSError:
+                        break
+                    if not data:
+                        break
+                    os.write(stdoutFD, data)
+        finally:
+            os.close(masterFD)
+            os.waitpid(pid, 0)
+            os.close(logFD)
+
+
+def runReader(logDir):
+    '''Read keys the same way `terminalInput.readKey` does, logging each key along with the arrival of its last byte.
+
+    '''
+    logFD = _openLog(_readerLogPath(logDir))
+
+    with rawStdin():
+        _writeLog(logFD, t=_now(), ready=True)
+
+        while True:
+            response = [readByte()]
+            firstTime = lastTime = _now()
+
+            char = readByte(terminalInput.defaultTimeout)
+            while char:
+                lastTime = _now()
+                response.append(char)
+                char = readByte(terminalInput.defaultTimeout)
+
+            key = ''.join(response)
+            _writeLog(logFD, t=lastTime, first=firstTime, data=key)
+
+            if key == CTRL_D:
+                break
+
+    os.close(logFD)
+
+
+def syntheticKeys(surveyFile=None):
+    '''Return an ordered mapping of key combination names to the sequences the synthetic key source will send.
+
+    '''
+    if surveyFile is not None:
+        with open(surveyFile) as f:
+            results = json.load(f, object_pairs_hook=OrderedDict)['results']
+        return OrderedDict((combo, seq) for combo, seq in results.items() if seq)
+
+    keys = OrderedDict()
+    for key, (plainSeq, modifiedSeq) in xtermKeys.items():
+        keys[key] = plainSeq
+        for mod, modNum in xtermModifiers.items():
+            keys['{}+{}'.format(mod, key)] = modifiedSeq.format(modNum)
+
+    return keys
+
+
+def percentile(values, fraction):
+    '''Return the nearest-rank percentile of `values`.
+
+    '''
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _latencyStats(latencies):
+    ms = [latency * 1000 for latency in latencies]
+    return OrderedDict((
+        ('samples', len(ms)),
+        ('p50 ms', percentile(ms, 0.5)),
+        ('p90 ms', percentile(ms, 0.9)),
+        ('p99 ms', percentile(ms, 0.99)),
+        ('max ms', max(ms) if ms else None),
+    ))
+
+
+def _chunksBetween(chunks, start, end):
+    return [chunk for chunk in chunks if start <= chunk['t'] < end]
+
+
+def analyze(layers, sends, endTime, hopLogs, readerLog):
+    '''Attribute the logged chunks at every hop to the key that was sent, and summarize each layer.
+
+    `sends` is a list of `(combo, sequence, sendTime)`, and `endTime` is when the end marker was sent; `hopLogs` holds
+    the chunks logged by hops 1..N (hop 0 is the synthetic source itself).
+
+    '''
+    names = list(layers) + ['reader']
+    perLayer = [{'latencies': [], 'fragmented': 0, 'chunks': [], 'rewrites': OrderedDict()} for _ in names]
+    captured = OrderedDict()
+    dropped = []
+
+    for index, (combo, seq, sendTime) in enumerate(sends):
+        nextTime = sends[index + 1][2] if index + 1 < len(sends) else endTime
+
+        previousData, previousTime = seq, sendTime
+        for layerIndex, name in enumerate(names):
+            if name == 'reader':
+                chunks = _chunksBetween(readerLog, sendTime, nextTime)
+                data = ''.join(chunk['data'] for chunk in chunks)
+                captured.setdefault(combo, data)
+            else:
+                chunks = _chunksBetween(hopLogs[layerIndex], sendTime, nextTime)
+                data = ''.join(chunk['data'] for chunk in chunks)
+
+            if not chunks:
+                dropped.append(OrderedDict((('combo', combo), ('layer', name))))
+                break
+
+            stats = perLayer[layerIndex]
+            stats['latencies'].append(chunks[-1]['t'] - previousTime)
+            stats['chunks'].append(len(chunks))
+            if len(chunks) > 1:
+                stats['fragmented'] += 1
+            if data != previousData:
+                stats['rewrites'].setdefault(combo, (previousData, data))
+
+            previousData, previousTime = data, chunks[-1]['t']
+
+    profile = []
+    for name, stats in zip(names, perLayer):
+        profile.append(OrderedDict((
+            ('layer', name),
+            ('added latency', _latencyStats(stats['latencies'])),
+            ('fragmented keys', stats['fragmented']),
+            ('max chunks per key', max(stats['chunks']) if stats['chunks'] else None),
+            ('rewritten combos', OrderedDict(
+                (combo, OrderedDict((('in', before), ('out', after))))
+                for combo, (before, after) in stats['rewrites'].items()
+            )),
+        )))
+
+    return captured, profile, dropped
+
+
+def runProfile(layers, keys, repeat, term):
+    logDir = tempfile.mkdtemp(prefix='term-layer-profile-')
+    command = _layerCommand(layers[0], _hopCommand(1, layers, logDir)) if layers else _readerCommand(logDir)
+
+    pid, masterFD = _spawn(command, term)
+    fcntl.ioctl(masterFD, termios.TIOCSWINSZ, struct.pack('HHHH', 24, 80, 0, 0))
+
+    reader = _LogFollower(_readerLogPath(logDir))
+    sends = []
+
+    try:
+        deadline = _now() + readyTimeout
+        while not reader.update():
+            if _now() > deadline or not _drain(masterFD, 0.1):
+                raise RuntimeError('The reader at the end of the chain never became ready.')
+
+        for _ in range(repeat):
+            for combo, seq in keys.items():
+                seenRecords = len(reader.update())
+
+                sends.append((combo, seq, _now()))
+                os.write(masterFD, seq.encode('utf-8'))
+
+                deadline = _now() + keyTimeout
+                while len(reader.update()) == seenRecords and _now() < deadline:
+                    _drain(masterFD, pollInterval)
+
+        endTime = _now()
+        os.write(masterFD, CTRL_D.encode('utf-8'))
+        deadline = _now() + exitTimeout
+        while _now() < deadline and _drain(masterFD, 0.1):
+            pass
+
+    finally:
+        try:
+            os.kill(pid, signal.SIGHUP)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        os.close(masterFD)
+
+    hopLogs = [_readLog(_hopLogPath(logDir, hop)) for hop in range(1, len(layers) + 1)]
+    readerLog = [record for record in reader.update() if 'data' in record]
+    shutil.rmtree(logDir, ignore_errors=True)
+
+    return analyze(layers, sends, endTime, hopLogs, readerLog)
+
+
+def _printProfile(profile, dropped):
+    layerColWidth = max(len(layer['layer']) for layer in profile) + 2
+
+    colors.printHeading('Added latency per layer:')
+    print(
+        template(' {c.bold}{c.green}{: <{}} {: >8} {: >8} {: >8} {: >8} {: >11} {: >9}{c.reset}')
+        .format('Layer', layerColWidth, 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'fragmented', 'rewrites')
+    )
+    for layer in profile:
+        latency = layer['added latency']
+        print(
+            template(' {c.yellow}{: <{}}{c.reset} {: >8} {: >8} {: >8} {: >8} {: >11} {: >9}').format(
+                layer['layer'], layerColWidth,
+                *('{:.2f}'.format(latency[stat]) if latency[stat] is not None else '-'
+                  for stat in ('p50 ms', 'p90 ms', 'p99 ms', 'max ms')),
+                layer['fragmented keys'], len(layer['rewritten combos'])
+            )
+        )
+
+    for layer in profile:
+        for combo, rewrite in layer['rewritten combos'].items():
+            print(
+                template(' {c.yellow}{}{c.reset}: {c.bold}{}{c.reset} rewrote {c.userInput}{}{c.reset} to '
+                         '{c.userInput}{}{c.reset}')
+                .format(combo, layer['layer'], displayableKey(rewrite['in']), displayableKey(rewrite['out']))
+            )
+
+    if dropped:
+        print()
+        colors.printWarning('{} key(s) never made it through the chain.'.format(len(dropped)), file=sys.stdout)
+
+
+def main():
+    args = parser.parse_args()
+    layers = args.layers or ['pty']
+
+    if args.reader:
+        runReader(args.log_dir)
+        return
+
+    if args.hop is not None:
+        runRelay(args.hop, layers, args.log_dir)
+        return
+
+    for layer in layers:
+        if layer not in layerPresets and '{cmd}' not in layer:
+            parser.error('unknown layer {!r}; use one of {} or a command containing {{cmd}}'
+                         .format(layer, ', '.join(layerPresets)))
+
+    print(__doc__)
+    print('Layers: {}'.format(' -> '.join(template('{c.bold}{}{c.reset}').format(layer) for layer in layers)))
+    print()
+
+    keys = syntheticKeys(args.survey)
+    captured, profile, dropped = runProfile(layers, keys, args.repeat, args.term)
+
+    _printProfile(profile, dropped)
+
+    outObject = OrderedDict((
+        ('environment', OrderedDict((
+            ('TERM variable', args.term),
+            ('layers', ', '.join(layers)),
+        ))),
+        ('results', captured),
+        ('layer profile', OrderedDict((
+            ('layers', profile),
+            ('dropped', dropped),
+        ))),
+    ))
+
+    outFilename = args.output or 'term-layer-profile-{}.json'.format('-'.join(
+        layer if layer in layerPresets else 'custom' for layer in layers
+    ))
+    print()
+    print(template('Writing results to {c.cyan}{}{c.reset} ...').format(outFilename))
+    with open(outFilename, 'w') as f:
+        json.dump(outObject, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+'''Survey the mouse, focus and bracketed-paste reports a terminal sends.
+
+Each section turns on one reporting mode, records everything the terminal sends for a while, and decodes it with
+`EventParser`. Input is read in bulk (see `readChunk`) and parsed as bytes, since mouse motion can arrive at hundreds of
+events per second and pastes can be many kilobytes long; consecutive motion reports are coalesced into one event.
+
+'''
+from collections import Counter, OrderedDict
+import re
+import select
+import sys
+import time
+
+from terminalOutput import colors, csi, template
+from terminalInput import CTRL_C, rawStdin, readChunk
+
+
+def _modes(*numbers):
+    return csi(flag='?' + ';'.join(str(number) for number in numbers) + 'h'), \
+        csi(flag='?' + ';'.join(str(number) for number in numbers) + 'l')
+
+
+# Mouse tracking: 1000 = presses and releases, 1002 = motion while a button is held, 1003 = any motion.
+# Encodings: the default (X10-style) one, 1006 = SGR, 1015 = urxvt.
+sections = OrderedDict((
+    ('mouse-x10', _modes(1000, 1002, 1003)),
+    ('mouse-sgr', _modes(1000, 1002, 1003, 1006)),
+    ('mouse-urxvt', _modes(1000, 1002, 1003, 1015)),
+    ('focus', _modes(1004)),
+    ('paste', _modes(2004)),
+))
+
+instructions = OrderedDict((
+    ('mouse-x10', 'Move the mouse, click and scroll inside this window'),
+    ('mouse-sgr', 'Move the mouse, click and scroll inside this window'),
+    ('mouse-urxvt', 'Move the mouse, click and scroll inside this window'),
+    ('focus', 'Switch to another window and back, a few times'),
+    ('paste', 'Paste some text (preferably several lines, or a few kilobytes)'),
+))
+
+# Keys that end a section when pressed on their own.
+endKeys = (b'\r', b'\n', b'\r\n', CTRL_C.encode())
+
+pasteStart = b'\x1b[200~'
+pasteEnd = b'\x1b[201~'
+
+sgrMouseRE = re.compile(rb'\x1b\[<(\d+);(\d+);(\d+)([Mm])')
+urxvtMouseRE = re.compile(rb'\x1b\[(\d+);(\d+);(\d+)M')
+csiRE = re.compile(rb'\x1b\[[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e]')
+partialCSIRE = re.compile(rb'\x1b(\[[\x30-\x3f]*[\x20-\x2f]*|O)?\Z')
+
+modifierBits = OrderedDict((('Shift', 4), ('Meta', 8), ('Ctrl', 16)))
+
+
+class Event(object):
+    '''A single decoded report; `count` is the number of raw reports coalesced into it.
+
+    `firstTime` is when the first of those reports arrived (for pastes, when the start marker became readable), and
+    `time` when the last one did. Coalesced mouse events keep the position of their last report in `x` and `y`, and
+    the largest coordinates of any of them in `maxX` and `maxY`.
+
+    '''
+    __slots__ = ('kind', 'firstTime', 'time', 'raw', 'count', 'encoding', 'button', 'x', 'y', 'maxX', 'maxY',
+                 'pressed', 'motion', 'modifiers', 'text')
+
+    def __init__(self, kind, timestamp, raw, **fields):
+        super().__init__()
+
+        self.kind = kind
+        self.firstTime = fields.get('firstTime', timestamp)
+        self.time = timestamp
+        self.raw = raw
+        self.count = 1
+        self.encoding = fields.get('encoding')
+        self.button = fields.get('button')
+        self.x = fields.get('x')
+        self.y = fields.get('y')
+        self.maxX = self.x
+        self.maxY = self.y
+        self.pressed = fields.get('pressed')
+        self.motion = fields.get('motion', False)
+        self.modifiers = fields.get('modifiers', ())
+        self.text = fields.get('text')
+
+    def coalesces(self, other):
+        return self.kind == other.kind == 'mouse' and self.motion and other.motion \
+            and (self.encoding, self.button, self.modifiers) == (other.encoding, other.button, other.modifiers)
+
+
+def _mouseEvent(timestamp, raw, encoding, code, x, y, pressed=True):
+    if code & 3 == 3 and not code & (64 | 128):
+        # A release (X10 and urxvt don't say which button), or motion with no button held.
+        button, pressed = None, False
+    else:
+        button = (code & 3) + (4 if code & 64 else 0) + (8 if code & 128 else 0) + 1
+
+    return Event(
+        'mouse', timestamp, raw, encoding=encoding, button=button, x=x, y=y, pressed=pressed, motion=bool(code & 32),
+        modifiers=tuple(name for name, bit in modifierBits.items() if code & bit)
+    )
+
+
+class EventParser(object):
+    '''Incrementally decode the reports in a stream of terminal input.
+
+    Feed it chunks of bytes as they arrive; sequences split across chunks are held back until the rest arrives.
+    Anything that isn't a mouse, focus or paste report is returned as a `key` event.
+
+    '''
+    def __init__(self, coalesce=True):
+        super().__init__()
+
+        self.coalesce = coalesce
+        self.pending = b''
+        self.pasteParts = None
+        self.pasteStartTime = None
+        self.pasteChunks = 0
+        self.events = []
+
+    def _emit(self, event):
+        if self.coalesce and self.events and event.coalesces(self.events[-1]):
+            last = self.events[-1]
+            last.x, last.y, last.time = event.x, event.y, event.time
+            last.maxX, last.maxY = max(last.maxX, event.x), max(last.maxY, event.y)
+            last.count += 1
+        else:
+            self.events.append(event)
+
+    def _feedPaste(self, data, pos, timestamp):
+        # Pastes are scanned for their end marker in bulk, rather than being decoded sequence by sequence.
+        self.pasteChunks += 1
+        end = data.find(pasteEnd, pos)
+        if end < 0:
+            # Hold back anything that could be the start of the end marker.
+            keep = max(pos, len(data) - len(pasteEnd) + 1)
+            while keep < len(data) and not pasteEnd.startswith(data[keep:]):
+                keep += 1
+            self.pasteParts.append(data[pos:keep])
+            self.pending = data[keep:]
+            return len(data)
+
+        self.pasteParts.append(data[pos:end])
+        content = b''.join(self.pasteParts)
+        event = Event('paste', timestamp, pasteStart + content + pasteEnd, firstTime=self.pasteStartTime,
+                      text=content.decode('utf-8', 'replace'))
+        event.count = self.pasteChunks
+        self.events.append(event)
+        self.pasteParts = None
+        return end + len(pasteEnd)
+
+    def _feedSequence(self, data, pos, timestamp, readyTime):
+        '''Decode the sequence starting with the ESC at `data[pos]`; return where it ends, or None if it's incomplete.
+
+        '''
+        if data.startswith(b'\x1b[M', pos):
+            if len(data) < pos + 6:
+                return None
+            code, x, y = data[pos + 3] - 32, data[pos + 4] - 32, data[pos + 5] - 32
+            self._emit(_mouseEvent(timestamp, data[pos:pos + 6], 'x10', code, x, y))
+            return pos + 6
+
+        match = sgrMouseRE.match(data, pos) or urxvtMouseRE.match(data, pos)
+        if match and match.re is sgrMouseRE:
+            code, x, y = int(match.group(1)), int(match.group(2)), int(match.group(3))
+            self._emit(_mouseEvent(timestamp, match.group(0), 'sgr', code, x, y, pressed=match.group(4) == b'M'))
+            return match.end()
+        elif match:
+            code, x, y = int(match.group(1)) - 32, int(match.group(2)), int(match.group(3))
+            self._emit(_mouseEvent(timestamp, match.group(0), 'urxvt', code, x, y))
+            return match.end()
+
+        match = csiRE.match(data, pos)
+        if match is None:
+            if partialCSIRE.match(data, pos):
+                return None
+            end = min(pos + (3 if data.startswith(b'\x1bO', pos) else 2), len(data))
+            self._emit(Event('key', timestamp, data[pos:end]))
+            return end
+
+        sequence = match.group(0)
+        if sequence == pasteStart:
+            self.pasteParts = []
+            self.pasteStartTime = readyTime
+            self.pasteChunks = 0
+        elif sequence in (b'\x1b[I', b'\x1b[O'):
+            self._emit(Event('focus', timestamp, sequence, pressed=sequence == b'\x1b[I'))
+        else:
+            self._emit(Event('key', timestamp, sequence))
+
+        return match.end()
+
+    def feed(self, data, timestamp=None, readyTime=None):
+        '''Decode a chunk of input, received at `timestamp`; returns the list of all events decoded so far.
+
+        `readyTime` is when the chunk became readable (default: `timestamp`); a paste that starts in this chunk is
+        timed from then, so that pastes arriving in a single read still take a measurable time.
+
+        '''
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        readyTime = timestamp if readyTime is None else readyTime
+        data = self.pending + data
+        self.pending = b''
+
+        pos = 0
+        while pos < len(data):
+            if self.pasteParts is not None:
+                pos = self._feedPaste(data, pos, timestamp)
+                continue
+
+            escape = data.find(b'\x1b', pos)
+            if escape < 0:
+                escape = len(data)
+            if escape > pos:
+                self._emit(Event('key', timestamp, data[pos:escape]))
+                pos = escape
+                continue
+
+            end = self._feedSequence(data, pos, timestamp, readyTime)
+            if end is None:
+                self.pending = data[pos:]
+                break
+            pos = end
+
+        return self.events
+
+    def finish(self):
+        '''Flush whatever is still held back (e.g. a lone ESC) as a key event.
+
+        '''
+        if self.pending:
+            self._emit(Event('key', time.monotonic(), self.pending))
+            self.pending = b''
+
+        return self.events
+
+
+def _peakRate(times, window=0.1):
+    peak = 0
+    start = 0
+    for end, endTime in enumerate(times):
+        while endTime - times[start] >= window:
+            start += 1
+        peak = max(peak, end - start + 1)
+
+    return round(peak / window, 1)
+
+
+def summarizeMouse(events):
+    mouseEvents = [event for event in events if event.kind == 'mouse']
+    if not mouseEvents:
+        return None
+
+    # Spread the reports coalesced into each event evenly between the times of its first and last ones.
+    times = []
+    for event in mouseEvents:
+        if event.count == 1:
+            times.append(event.time)
+        else:
+            step = (event.time - event.firstTime) / (event.count - 1)
+            times.extend(event.firstTime + step * index for index in range(event.count))
+    span = times[-1] - times[0]
+
+    return OrderedDict((
+        ('encodings', sorted(set(event.encoding for event in mouseEvents))),
+        ('example', mouseEvents[0].raw.decode('latin-1')),
+        ('reports', len(times)),
+        ('coalesced events', len(mouseEvents)),
+        ('motion reports', sum(event.count for event in mouseEvents if event.motion)),
+        ('button reports', sum(event.count for event in mouseEvents if not event.motion)),
+        ('buttons', sorted(set(event.button for event in mouseEvents if event.button is not None))),
+        ('modifiers', sorted(set(mod for event in mouseEvents for mod in event.modifiers))),
+        ('max x', max(event.maxX for event in mouseEvents)),
+        ('max y', max(event.maxY for event in mouseEvents)),
+        ('reports/s', round(len(times) / span, 1) if span > 0 else None),
+        ('peak reports/s', _peakRate(times)),
+    ))
+
+
+def summarizeFocus(events):
+    focusEvents = [event for event in events if event.kind == 'focus']
+    if not focusEvents:
+        return None
+
+    counts = Counter(event.raw.decode('latin-1') for event in focusEvents)
+    return OrderedDict((
+        ('sequences', OrderedDict(sorted(counts.items()))),
+        ('focus in', sum(event.count for event in focusEvents if event.pressed)),
+        ('focus out', sum(event.count for event in focusEvents if not event.pressed)),
+    ))
+
+
+def summarizePaste(events):
+    pastes = [event for event in events if event.kind == 'paste']
+    if not pastes:
+        unbracketed = sum(len(event.raw) for event in events if event.kind == 'key')
+        return OrderedDict((('bracketed', False), ('unbracketed bytes', unbracketed))) if unbracketed else None
+
+    sizes = [len(event.raw) - len(pasteStart) - len(pasteEnd) for event in pastes]
+    seconds = [event.time - event.firstTime for event in pastes]
+    totalSeconds = sum(seconds)
+
+    return OrderedDict((
+        ('bracketed', True),
+        ('pastes', len(pastes)),
+        ('bytes', sizes),
+        ('chunks', [event.count for event in pastes]),
+        ('seconds', [round(value, 6) for value in seconds]),
+        ('MB/s', round(sum(sizes) / totalSeconds / 1e6, 3) if totalSeconds > 0 else None),
+    ))
+
+
+def captureSection(name, duration, idleTime=1.0):
+    '''Turn on the reporting mode for section `name` and record events until the user presses Enter, or until
+    `duration` seconds after the first event (or `idleTime` seconds after the end of a paste).
+
+    Returns the parser holding the recorded events, or None if the user pressed Space (skip) before anything was
+    recorded.
+
+    '''
+    enable, disable = sections[name]
+    parser = EventParser()
+
+    sys.stdout.write(template('{c.bold}{}{c.reset} {c.dark.gray}({}; Enter when done, Space to skip){c.reset} ').format(
+        name, instructions[name]
+    ))
+    sys.stdout.flush()
+
+    with rawStdin():
+        sys.stdout.write(enable)
+        sys.stdout.flush()
+        try:
+            firstTime = None
+            deadline = None
+            while deadline is None or time.monotonic() < deadline:
+                # Wait for input separately from reading it, to know when it became readable.
+                if not select.select([sys.stdin], [], [],
+                                     None if deadline is None else max(0, deadline - time.monotonic()))[0]:
+                    continue
+                readyTime = time.monotonic()
+                chunk = readChunk(0)
+                now = time.monotonic()
+                if not chunk:
+                    continue
+
+                eventCount = len(parser.events)
+                events = parser.feed(chunk, now, readyTime)
+
+                keys = [event.raw for event in events[eventCount:] if event.kind == 'key']
+                if not firstTime and keys in ([b' '], [CTRL_C.encode()]):
+                    return None
+                elif any(key in endKeys for key in keys):
+                    # Only a lone Enter ends the section; an unbracketed paste also contains line breaks.
+                    break
+
+                if firstTime is None and events:
+                    firstTime = now
+                    deadline = now + duration
+                if name == 'paste' and any(event.kind == 'paste' for event in events) and parser.pasteParts is None:
+                    deadline = min(deadline, now + idleTime)
+        finally:
+            sys.stdout.write(disable)
+            sys.stdout.flush()
+
+    parser.finish()
+    # Drop the keypress that ended the section.
+    if parser.events and parser.events[-1].kind == 'key' and parser.events[-1].raw in endKeys:
+        parser.events.pop()
+
+    return parser
+
+
+def runEventSurvey(names=None, duration=5.0):
+    '''Run each of the named sections (default: all of them), and return a summary of what each one recorded.
+
+    '''
+    results = OrderedDict()
+
+    for name in names or sections:
+        parser = captureSection(name, duration)
+        if parser is None:
+            results[name] = None
+            continue
+
+        if name == 'focus':
+            results[name] = summarizeFocus(parser.events)
+        elif name == 'paste':
+            results[name] = summarizePaste(parser.events)
+        else:
+            results[name] = summarizeMouse(parser.events)
+
+        if results[name] is None:
+            colors.printWarning('nothing was reported', file=sys.stdout)
+
+    return results
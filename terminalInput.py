@@ -3,21 +3,32 @@
 '''
 from contextlib import contextmanager
 import os
+import re
 import readline
+import select
+import signal
 import sys
 import termios
 from termios import IGNBRK, BRKINT, PARMRK, ISTRIP, INLCR, IGNCR, ICRNL, IXON, OPOST, ECHO, ECHONL, ICANON, ISIG, \
         IEXTEN, CSIZE, CS8
 import time
 
-from terminalOutput import cursor, console, colors, promptColors
+from terminalOutput import cursor, console, colors, template
+import instrumentation
 
 
 defaultTimeout = 0.05
-sleepTime = 0.01
+cprTimeout = 1.0
+
+# The query used to find key boundaries with a cursor position report (see `detectCursorPositionReport`), or None to
+# find them by waiting for `defaultTimeout` seconds of silence.
+cursorPositionQuery = None
+
+cursorPositionReplyRE = re.compile(r'\x1b\[(\?)?(\d+);(\d+)(?:;\d+)?R$')
 
 
 CTRL_C = '\x03'
+CTRL_D = '\x04'
 
 fishCharMap = {
     '\x1b': r'\e',
@@ -26,11 +37,11 @@ fishCharMap = {
     "'": r"\'",
     '\x07': r'\a',
     '\x08': r'\b',
-    '\x12': r'\f',
-    '\x10': r'\n',
-    '\x13': r'\r',
+    '\x0c': r'\f',
+    '\x0a': r'\n',
+    '\x0d': r'\r',
     '\x09': r'\t',
-    '\x11': r'\v',
+    '\x0b': r'\v',
     ' ': "' '",
     '$': r'\$',
     '*': r'\*',
@@ -58,11 +69,11 @@ readlineCharMap = {
     "'": r"\'",
     '\x07': r'\a',
     '\x08': r'\b',
-    '\x12': r'\f',
-    '\x10': r'\n',
-    '\x13': r'\r',
+    '\x0c': r'\f',
+    '\x0a': r'\n',
+    '\x0d': r'\r',
     '\x09': r'\t',
-    '\x11': r'\v',
+    '\x0b': r'\v',
 }
 
 
@@ -88,11 +99,8 @@ class BackException(BaseException):
     pass
 
 
-@contextmanager
-def rawStdin():
-    oldTermAttr = termios.tcgetattr(sys.stdin)
-
-    iflag, oflag, cflag, lflag, ispeed, ospeed, specialChars = termios.tcgetattr(sys.stdin)
+def _rawAttributes(termAttr):
+    iflag, oflag, cflag, lflag, ispeed, ospeed, specialChars = termAttr
     # Pretty much set up raw mode.
     iflag &= ~(IGNBRK | BRKINT | PARMRK | ISTRIP | INLCR | IGNCR | ICRNL | IXON)
     oflag &= ~OPOST
@@ -100,18 +108,139 @@ def rawStdin():
     # Set 8-bit character size (probably not needed)
     cflag = (cflag & ~CSIZE) | CS8
 
-    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, [iflag, oflag, cflag, lflag, ispeed, ospeed, specialChars])
-    os.set_blocking(sys.stdin.fileno(), False)
+    return [iflag, oflag, cflag, lflag, ispeed, ospeed, specialChars]
 
+
+_rawDepth = 0
+_suspended = False
+_originalTermAttr = None
+_rawTermAttr = None
+_previousSignalHandlers = {}
+
+# Signals that end the process, so the terminal has to be restored first.
+_exitSignals = (signal.SIGTERM, signal.SIGHUP)
+
+
+def _setRaw():
+    # Switching into raw mode doesn't need to wait for pending output; switching back does (see `_setCooked`).
+    termios.tcsetattr(sys.stdin, termios.TCSANOW, _rawTermAttr)
+    os.set_blocking(sys.stdin.fileno(), False)
     globals()['stdinIsRaw'] = True
 
-    yield
 
+def _setCooked():
     globals()['stdinIsRaw'] = False
-
     os.set_blocking(sys.stdin.fileno(), True)
-    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, oldTermAttr)
-    sys.stdout.write('\n')
+    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, _originalTermAttr)
+
+
+def _handleExitSignal(signum, frame):
+    wasRaw = stdinIsRaw
+    previous = _previousSignalHandlers.get(signum)
+
+    _setCooked()
+    _restoreSignalHandlers()
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        os.kill(os.getpid(), signum)
+
+    # Still running: the signal was ignored (e.g. under nohup), or the previous handler returned.
+    if wasRaw:
+        _setRaw()
+    _installSignalHandlers()
+
+
+def _handleStop(signum, frame):  # pylint: disable=unused-argument
+    # Give the shell its terminal back while stopped; SIGCONT switches back to raw mode.
+    _setCooked()
+    signal.signal(signal.SIGTSTP, signal.SIG_DFL)
+    os.kill(os.getpid(), signal.SIGTSTP)
+
+
+def _handleContinue(signum, frame):  # pylint: disable=unused-argument
+    if _rawDepth and not _suspended:
+        _setRaw()
+        signal.signal(signal.SIGTSTP, _handleStop)
+
+
+def _installSignalHandlers():
+    handlers = dict.fromkeys(_exitSignals, _handleExitSignal)
+    handlers.update({signal.SIGTSTP: _handleStop, signal.SIGCONT: _handleContinue})
+
+    for signum, handler in handlers.items():
+        try:
+            _previousSignalHandlers[signum] = signal.signal(signum, handler)
+        except ValueError:  # Not in the main thread
+            break
+
+
+def _restoreSignalHandlers():
+    while _previousSignalHandlers:
+        signum, handler = _previousSignalHandlers.popitem()
+        signal.signal(signum, handler if handler is not None else signal.SIG_DFL)
+
+
+@contextmanager
+def rawStdin():
+    '''Put the terminal in raw, non-blocking mode for the duration of a session.
+
+    Sessions nest: entering one while stdin is already raw costs nothing, and a nested session only switches modes if
+    stdin isn't raw (e.g. inside `cookedStdin`). The original attributes are always restored when the outermost session
+    ends, whether by an exception or by SIGTERM or SIGHUP; if the process is stopped, the terminal is restored until
+    it continues.
+
+    '''
+    global _rawDepth, _suspended, _originalTermAttr, _rawTermAttr  # pylint: disable=global-statement
+
+    if _rawDepth:
+        suspended = _suspended
+        switch = not stdinIsRaw
+        _rawDepth += 1
+        try:
+            if switch:
+                _suspended = False
+                _setRaw()
+            yield
+        finally:
+            _rawDepth -= 1
+            if switch:
+                _setCooked()
+                _suspended = suspended
+        return
+
+    _originalTermAttr = termios.tcgetattr(sys.stdin)
+    _rawTermAttr = _rawAttributes(_originalTermAttr)
+
+    _rawDepth = 1
+    _installSignalHandlers()
+    try:
+        _setRaw()
+        yield
+    finally:
+        _rawDepth = 0
+        _setCooked()
+        _restoreSignalHandlers()
+
+
+@contextmanager
+def cookedStdin():
+    '''Temporarily restore the terminal's original mode inside a raw session (e.g. to read a line with readline).
+
+    '''
+    global _suspended  # pylint: disable=global-statement
+
+    if not stdinIsRaw:
+        yield
+        return
+
+    _suspended = True
+    _setCooked()
+    try:
+        yield
+    finally:
+        _suspended = False
+        _setRaw()
 
 
 def readByte(timeout=None):
@@ -119,18 +248,50 @@ def readByte(timeout=None):
         with rawStdin():
             return readByte(timeout)
 
-    startTime = os.times().elapsed
+    deadline = None if timeout is None else time.monotonic() + timeout
 
-    byte = None
-    while not byte:
-        if timeout is not None and os.times().elapsed - startTime > timeout:
-            return None
+    while True:
         try:
             byte = sys.stdin.read(1)
         except BlockingIOError:
-            time.sleep(sleepTime)
+            byte = None
+        if byte:
+            return byte
+
+        # Nothing is buffered, so wait for the terminal to send more.
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return None
+        select.select([sys.stdin], [], [], remaining)
+        if instrumentation.enabled:
+            instrumentation.count('poll wakeups')
+
+
+def readChunk(timeout=None, size=65536):
+    '''Read whatever bytes the terminal has sent (up to `size`), waiting up to `timeout` seconds for some to arrive.
+
+    Returns an empty bytes object on timeout. This reads straight from the file descriptor, bypassing the text layer
+    of `sys.stdin`; only use it once everything read through `readByte` has been consumed.
+
+    '''
+    if not stdinIsRaw:
+        with rawStdin():
+            return readChunk(timeout, size)
+
+    fd = sys.stdin.fileno()
+    if not select.select([fd], [], [], timeout)[0]:
+        return b''
+
+    try:
+        chunk = os.read(fd, size)
+    except BlockingIOError:
+        chunk = b''
+
+    if instrumentation.enabled:
+        instrumentation.count('chunk reads')
+        instrumentation.count('bytes read', len(chunk))
 
-    return byte
+    return chunk
 
 
 def controlCode(char, prefix=r'\C-'):
@@ -203,12 +364,41 @@ def displayableKey(chars, mode='fish'):
     return ''.join(result)
 
 
+def charKind(char):
+    '''Classify a character for display: an escape character, a control character, some other character that needs
+    escaping, or an ordinary character (the empty string).
+
+    '''
+    if char == '\x1b':
+        return 'escapeChar'
+    elif char not in fishCharMap and 0x1 <= ord(char) <= 0x1a:
+        return 'ctrlChar'
+    elif fishDisplayableChar(char) != char:
+        return 'escapeSequence'
+
+    return ''
+
+
+def charTitle(char):
+    return '{}\n{:03o} oct\n{} dec\n{:02X} hex'.format(fishDisplayableChar(char), ord(char), ord(char), ord(char))
+
+
+def displayTokens(chars):
+    '''Return a `[text, kind, title]` token for each character of `chars`, using the fish encoding.
+
+    '''
+    if chars is None:
+        return None
+
+    return [[fishDisplayableChar(char), charKind(char), charTitle(char)] for char in chars]
+
+
 def displayKey(chars):
     dispKey = displayableKey(chars)
     if dispKey is None:
-        sys.stdout.write('{c.dark.gray}(skipped){c.reset}'.format(c=colors))
+        sys.stdout.write(template('{c.dark.gray}(skipped){c.reset}').format())
     else:
-        sys.stdout.write('{c.userInput}{}{c.reset}'.format(dispKey, c=colors))
+        sys.stdout.write(template('{c.userInput}{}{c.reset}').format(dispKey))
     sys.stdout.flush()
 
 
@@ -217,17 +407,168 @@ def readKey():
         with rawStdin():
             return readKey()
 
+    if instrumentation.enabled:
+        startTime = time.perf_counter()
+
     response = []
 
     char = readByte()
-    while char:
-        response.append(char)
+    if cursorPositionQuery is not None:
+        response = _readUntilCursorPositionReply(char)
+    else:
+        while char:
+            response.append(char)
+
+            char = readByte(defaultTimeout)
 
-        char = readByte(defaultTimeout)
+    if instrumentation.enabled:
+        instrumentation.addTime('readKey', time.perf_counter() - startTime)
 
     return ''.join(response)
 
 
+def _isCursorPositionReply(match):
+    # Modified F3 is sent as `CSI 1 ; <modifiers> R` by many terminals, which is indistinguishable from a plain cursor
+    # position report for row 1; since the prompt is hardly ever on the first row, assume those are keys.
+    return match.group(1) == '?' or match.group(2) != '1'
+
+
+def _readUntilCursorPositionReply(firstChar):
+    '''Read the rest of a key whose first character is `firstChar`, using a cursor position report as an end marker.
+
+    Everything the terminal sends before its reply to `cursorPositionQuery` belongs to the key. If no reply comes
+    within `cprTimeout` seconds, whatever was read until then is returned.
+
+    '''
+    sys.stdout.write(cursorPositionQuery)
+    sys.stdout.flush()
+
+    response = [firstChar]
+    deadline = time.monotonic() + cprTimeout
+
+    while True:
+        char = readByte(max(0, deadline - time.monotonic()))
+        if char is None:
+            break
+
+        response.append(char)
+        if char == 'R':
+            match = cursorPositionReplyRE.search(''.join(response))
+            if match and _isCursorPositionReply(match):
+                return response[:len(response) - len(match.group(0))]
+
+    # Timed out; the reply may still have come for a cursor on the first row.
+    match = cursorPositionReplyRE.search(''.join(response))
+    if match and len(match.group(0)) < len(response):
+        return response[:len(response) - len(match.group(0))]
+
+    return response
+
+
+def queryCursorPosition(query='\x1b[6n', timeout=cprTimeout):
+    '''Ask the terminal where the cursor is; return `(row, column)`, or None if it doesn't answer within `timeout`.
+
+    Anything else the terminal sends before its reply is discarded.
+
+    '''
+    if not stdinIsRaw:
+        with rawStdin():
+            return queryCursorPosition(query, timeout)
+
+    sys.stdout.write(query)
+    sys.stdout.flush()
+
+    response = []
+    deadline = time.monotonic() + timeout
+
+    while True:
+        char = readByte(max(0, deadline - time.monotonic()))
+        if char is None:
+            return None
+
+        response.append(char)
+        if char == 'R':
+            match = cursorPositionReplyRE.search(''.join(response))
+            if match:
+                return int(match.group(2)), int(match.group(3))
+
+
+def detectCursorPositionReport(timeout=cprTimeout):
+    '''Find out whether the terminal answers cursor position queries, and if so, use them to find key boundaries.
+
+    The DEC form (`CSI ? 6 n`) is preferred, since its reply can't be mistaken for a key. Returns the query that will be
+    used, or None if the terminal answered neither (in which case keys are still separated by silence).
+
+    '''
+    global cursorPositionQuery  # pylint: disable=global-statement
+
+    cursorPositionQuery = None
+    for query in ('\x1b[?6n', '\x1b[6n'):
+        if queryCursorPosition(query, timeout) is not None:
+            cursorPositionQuery = query
+            break
+
+    return cursorPositionQuery
+
+
+def _csiEnd(chars, start):
+    '''Return the index just past the end of the CSI sequence whose parameters start at `chars[start]`.
+
+    '''
+    end = start
+    if end < len(chars) and chars[end] == '[':  # Linux console function keys: ESC [ [ A
+        return min(end + 2, len(chars))
+
+    while end < len(chars) and 0x30 <= ord(chars[end]) <= 0x3f:  # Parameter bytes
+        end += 1
+    while end < len(chars) and 0x20 <= ord(chars[end]) <= 0x2f:  # Intermediate bytes (or rxvt's `$` suffix)
+        end += 1
+    if end < len(chars) and 0x40 <= ord(chars[end]) <= 0x7e:  # Final byte
+        end += 1
+
+    return end
+
+
+def _sequenceEnd(chars, start):
+    '''Return the index just past the end of the key sequence starting at `chars[start]`.
+
+    '''
+    char = chars[start]
+    if char == '\x9b':
+        return _csiEnd(chars, start + 1)
+    elif char != '\x1b' or start + 1 >= len(chars):
+        return start + 1
+
+    nextChar = chars[start + 1]
+    if nextChar == '[':
+        return _csiEnd(chars, start + 2)
+    elif nextChar == 'O':
+        end = start + 2
+        while end < len(chars) and chars[end] in '0123456789;':
+            end += 1
+        return min(end + 1, len(chars))
+    elif nextChar == '\x1b':
+        # Meta (Alt) sent as an ESC prefix on another escape sequence.
+        return _sequenceEnd(chars, start + 1)
+
+    return start + 2
+
+
+def splitSequences(chars):
+    '''Split a stream of input into the individual key sequences it contains.
+
+    '''
+    sequences = []
+
+    start = 0
+    while start < len(chars):
+        end = _sequenceEnd(chars, start)
+        sequences.append(chars[start:end])
+        start = end
+
+    return sequences
+
+
 def getKey(prompt, allowSkip=False):
     if not stdinIsRaw:
         with rawStdin():
@@ -239,7 +580,7 @@ def getKey(prompt, allowSkip=False):
     response = readKey()
 
     if response == ' ' and allowSkip:
-        sys.stdout.write('{c.dark.gray}(skipped){c.reset}'.format(c=colors))
+        sys.stdout.write(template('{c.dark.gray}(skipped){c.reset}').format())
         sys.stdout.flush()
         response = None
     elif response == CTRL_C:
@@ -258,21 +599,70 @@ def getKey(prompt, allowSkip=False):
     return response
 
 
+def getKeyGroup(prompt, count):
+    '''Ask for `count` keys to be pressed in order, and return the sequence for each of them.
+
+    Pressing Space by itself skips the whole group; after the first key, Space skips just the key at that position.
+
+    '''
+    if not stdinIsRaw:
+        with rawStdin():
+            return getKeyGroup(prompt, count)
+
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+
+    sequences = []
+    while len(sequences) < count:
+        response = readKey()
+
+        if response == CTRL_C:
+            colors.printControlChar('^C\r')
+            raise QuitException()
+        elif not sequences and response == ' ':
+            sys.stdout.write(template('{c.dark.gray}(skipped){c.reset}\r\n').format())
+            sys.stdout.flush()
+            return [None] * count
+        elif not sequences and response == 'q':
+            displayKey(response)
+            raise QuitException()
+        elif not sequences and response == 'b':
+            displayKey(response)
+            raise BackException()
+
+        for seq in splitSequences(response)[:count - len(sequences)]:
+            if seq == ' ':
+                seq = None
+            sequences.append(seq)
+            displayKey(seq)
+            sys.stdout.write(' ')
+            sys.stdout.flush()
+
+    sys.stdout.write('\r\n')
+    sys.stdout.flush()
+
+    return sequences
+
+
 def getKeyWithName(keyName):
-    return getKey("Please press {c.bold}{c.yellow}{}{c.reset}... ".format(keyName, c=colors), allowSkip=False)
+    instrumentation.beginPrompt(keyName)
+    return getKey(template("Please press {c.bold}{c.yellow}{}{c.reset}... ").format(keyName), allowSkip=False)
 
 
 def yesNo(default=False):
-    with rawStdin():
+    if not stdinIsRaw:
+        with rawStdin():
+            return yesNo(default)
+
+    char = readByte()
+    while char not in 'yYnN\r\n' + CTRL_C:
         char = readByte()
-        while char not in 'yYnN\r\n' + CTRL_C:
-            char = readByte()
-        if char == CTRL_C:  # Ctrl+C
-            colors.printControlChar('^C\r')
-            sys.exit(1)
-        result = char in 'yY' or (char in '\r\n' and default)
-        colors.printUserInput(char if char in 'yYnN' else '(Y)' if char in '\r\n' else '(N)')
-        return result
+    if char == CTRL_C:  # Ctrl+C
+        colors.printControlChar('^C\r')
+        sys.exit(1)
+    result = char in 'yY' or (char in '\r\n' and default)
+    colors.printUserInput(char if char in 'yYnN' else '(Y)' if char in '\r\n' else '(N)')
+    return result
 
 
 def setReadlineText(text):
@@ -288,7 +678,8 @@ def readLine(prompt, initialText=None):
         setReadlineText(initialText)
 
     try:
-        return input('{}{c.userInput}'.format(prompt, c=promptColors))
+        with cookedStdin():
+            return input(template('{}{c.userInput}', prompt=True).format(prompt))
     except KeyboardInterrupt:
         colors.printControlChar('^C\r')
         sys.exit(1)
@@ -309,10 +700,11 @@ class MenuChoice(object):
 
 
 def chooseOne(title, choices, handleEsc=False):
+    instrumentation.beginPrompt(title)
     colors.printHeading(title)
 
-    unselectedPrefix = '{c.dark.gray} - {c.reset}'.format(c=colors)
-    selectedPrefix = '{c.green}-->{c.reset}'.format(c=colors)
+    unselectedPrefix = template('{c.dark.gray} - {c.reset}').format()
+    selectedPrefix = template('{c.green}-->{c.reset}').format()
 
     try:
         cursor.hide()
@@ -328,6 +720,9 @@ def chooseOne(title, choices, handleEsc=False):
 
         with rawStdin():
             def updateSelection():
+                if instrumentation.enabled:
+                    startTime = time.perf_counter()
+
                 cursor.setX()
                 sys.stdout.write(unselectedPrefix)
 
@@ -337,7 +732,7 @@ def chooseOne(title, choices, handleEsc=False):
                 console.eraseLine()
                 cursor.up()
                 console.eraseLine()
-                sys.stdout.write('  {c.red}{}{c.reset}'.format(selectedIndex, c=colors))
+                sys.stdout.write(template('  {c.red}{}{c.reset}').format(selectedIndex))
 
                 cursor.restorePos()
                 if selectedIndex > 0:
@@ -345,6 +740,9 @@ def chooseOne(title, choices, handleEsc=False):
                 sys.stdout.write(selectedPrefix)
                 sys.stdout.flush()
 
+                if instrumentation.enabled:
+                    instrumentation.addTime('chooseOne frame', time.perf_counter() - startTime)
+
             updateSelection()
             while True:
                 char = readKey()
@@ -368,7 +766,8 @@ def chooseOne(title, choices, handleEsc=False):
 
 
 def queryBasicKeys():
-    globals()['upChar'] = getKeyWithName('Up')
-    globals()['downChar'] = getKeyWithName('Down')
-    globals()['enterChar'] = getKeyWithName('Enter')
-    globals()['escChar'] = getKeyWithName('Esc')
+    with rawStdin():
+        globals()['upChar'] = getKeyWithName('Up')
+        globals()['downChar'] = getKeyWithName('Down')
+        globals()['enterChar'] = getKeyWithName('Enter')
+        globals()['escChar'] = getKeyWithName('Esc')
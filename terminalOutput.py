@@ -3,10 +3,15 @@
 '''
 from contextlib import contextmanager
 import inspect
+import os
+import re
+import string
 import sys
 from test.support import captured_stdout, captured_stderr
 import traceback
 
+import instrumentation
+
 
 def csi(*values, flag='m'):
     return '\x1b[{}{}'.format(';'.join(str(x) for x in values), flag)
@@ -24,6 +29,9 @@ def instantCSI(flag, prefix=(), suffix=()):
         suffix = tuple(suffix)
 
     def doCSI(*args):
+        if instrumentation.enabled:
+            instrumentation.count('CSI commands')
+
         args = prefix + args + suffix
         sys.stdout.write(csi(*args, flag=flag))
         sys.stdout.flush()
@@ -71,7 +79,7 @@ class RGBColor(object):
         self.parts = parts
 
     def __getitem__(self, part):
-        if len(self.parts) >= 5:  # 38;2;r;g;b (or 48;2;r;g;b)
+        if len(self.parts) >= 4:  # 38;2;r;g + b (or 48;2;r;g + b)
             return csi(*self.parts, part)
 
         return RGBColor(*self.parts, part)
@@ -195,6 +203,13 @@ class Colors(ColorsFull):
         self.userInput = self.index[180]
         self.controlChar = self.index[202]
 
+        # What to use instead of the 256-color styles above on 16-color terminals; their closest basic colors would
+        # be the gray used for skipped keys, or the yellow and red of warnings and errors.
+        self.basicFallbacks = {
+            str(self.userInput): self.magenta,
+            str(self.controlChar): self.light.blue,
+        }
+
     def wrapWith(self, *attribs, **kwargs):
         file = kwargs.pop('file', sys.stdout)
         if kwargs:
@@ -224,33 +239,33 @@ class Colors(ColorsFull):
         file = kwargs.pop('file', sys.stdout)
         showTraceback = kwargs.pop('showTraceback', sys.stdout)
 
-        wrapper = self.wrapWith(self.error, file=file)
+        wrapper = self.wrapWith(str(template('{c.error}')), file=file)
 
         wrapper(text, *args, **kwargs)
 
         if showTraceback and sys.exc_info() is not None:
             wrapper(traceback.print_exc, file=file)
 
-        file.write(self.reset)
+        file.write(str(template('{c.reset}')))
         file.flush()
 
     def printWarning(self, text, showTraceback=False, file=sys.stderr):
-        print('{c.warning}{}{c.reset}'.format(text, c=self), file=file)
+        print(template('{c.warning}{}{c.reset}').format(text), file=file)
 
         if showTraceback and sys.exc_info() is not None:
             traceback.print_exc(file=file)
 
-        file.write(self.reset)
+        file.write(str(template('{c.reset}')))
         file.flush()
 
     def printHeading(self, text, *attribs):
-        print('{c.heading}{}{}{c.reset}'.format(''.join(attribs), text, c=self))
+        print(template('{c.heading}{}{}{c.reset}').format(downgradeSGR(''.join(attribs), colorLevel), text))
 
     def printUserInput(self, text):
-        print('{c.userInput}{}{c.reset}'.format(text, c=self))
+        print(template('{c.userInput}{}{c.reset}').format(text))
 
     def printControlChar(self, text):
-        print('{c.controlChar}{}{c.reset}'.format(text, c=self))
+        print(template('{c.controlChar}{}{c.reset}').format(text))
 
 
 _outputFileStack = [sys.stdout]
@@ -328,10 +343,10 @@ class Printer(object):
         else:
             outputText = funcOrText
 
-        outputText = '{attribs}{}{c.reset}'.format(
-            outputText.replace(colors.reset, colors.reset + self.attribs),
-            attribs=self.attribs,
-            c=colors
+        attribs = downgradeSGR(''.join(self.attribs), colorLevel)
+        outputText = template('{attribs}{}{c.reset}').format(
+            outputText.replace(colors.reset, colors.reset + attribs),
+            attribs=attribs
         )
 
         print(outputText, file=self.outputFile)
@@ -367,3 +382,226 @@ class ReadlinePromptWrapper(object):
 
 colors = Colors()
 promptColors = ReadlinePromptWrapper(colors)
+
+
+# Color capability levels, from least to most capable.
+colorLevels = ('none', '16', '256', 'truecolor')
+
+# Approximate RGB values of the 16 basic colors (xterm defaults), used when downgrading to 16 colors.
+basicColorRGB = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0), (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0), (92, 92, 255), (255, 0, 255), (0, 255, 255),
+    (255, 255, 255),
+)
+
+cubeSteps = (0, 95, 135, 175, 215, 255)
+
+sgrRE = re.compile(r'\x1b\[([\d;]*)m')
+
+
+def _terminfoColors(term):
+    '''Return the number of colors terminfo lists for `term`, or None if it can't be looked up.
+
+    '''
+    try:
+        import curses  # pylint: disable=import-outside-toplevel
+        curses.setupterm(term, sys.__stdout__.fileno())
+        return curses.tigetnum('colors')
+    except Exception:  # pylint: disable=broad-except
+        # No curses module, no terminfo entry for `term`, or stdout isn't a file.
+        return None
+
+
+def detectColorLevel(environ=None):
+    '''Guess how many colors the terminal supports, honoring NO_COLOR (https://no-color.org/).
+
+    Terminals that don't say otherwise are assumed to handle 256 colors (nearly all do nowadays), unless their
+    terminfo entry lists fewer.
+
+    '''
+    environ = os.environ if environ is None else environ
+
+    term = environ.get('TERM', '')
+    if environ.get('NO_COLOR') or term == 'dumb':
+        return 'none'
+    elif environ.get('COLORTERM', '').lower() in ('truecolor', '24bit'):
+        return 'truecolor'
+    elif '256' in term:
+        return '256'
+
+    terminfoColors = _terminfoColors(term)
+    if terminfoColors is None or terminfoColors >= 256:
+        return '256'
+    elif terminfoColors >= 8:
+        return '16'
+
+    return 'none'
+
+
+def indexedToRGB(index):
+    if index < 16:
+        return basicColorRGB[index]
+    elif index < 232:
+        index -= 16
+        return cubeSteps[index // 36], cubeSteps[index // 6 % 6], cubeSteps[index % 6]
+
+    gray = 8 + (index - 232) * 10
+    return gray, gray, gray
+
+
+def _distance(rgb1, rgb2):
+    return sum((a - b) ** 2 for a, b in zip(rgb1, rgb2))
+
+
+def rgbToIndexed(rgb):
+    '''Return the closest color to `rgb` in the 6x6x6 cube or gray ramp of the 256-color palette.
+
+    '''
+    cube = tuple(min(range(6), key=lambda step, part=part: abs(cubeSteps[step] - part)) for part in rgb)
+    cubeIndex = 16 + cube[0] * 36 + cube[1] * 6 + cube[2]
+
+    grayIndex = 232 + min(23, max(0, (sum(rgb) // 3 - 3) // 10))
+
+    return min((cubeIndex, grayIndex), key=lambda index: _distance(indexedToRGB(index), rgb))
+
+
+def rgbToBasic(rgb):
+    # Keep colors colored: a muted color like 180 (tan) is closer to gray than to any of the basic hues.
+    candidates = range(16) if max(rgb) - min(rgb) < 48 else (1, 2, 3, 4, 5, 6, 9, 10, 11, 12, 13, 14)
+    return min(candidates, key=lambda index: _distance(basicColorRGB[index], rgb))
+
+
+def _downgradeParams(params, level):
+    result = []
+
+    while params:
+        param = params.pop(0)
+
+        if param in (38, 48) and params:
+            base = param - 8
+            if params[0] == 2 and len(params) >= 4:
+                rgb = tuple(params[1:4])
+                del params[:4]
+            elif params[0] == 5 and len(params) >= 2:
+                rgb = None
+                index = params[1]
+                del params[:2]
+            else:
+                result.append(param)
+                continue
+
+            if level == 'truecolor' and rgb is not None:
+                result.extend((param, 2) + rgb)
+            elif level in ('truecolor', '256'):
+                result.extend((param, 5, index if rgb is None else rgbToIndexed(rgb)))
+            elif level == '16':
+                basic = rgbToBasic(rgb if rgb is not None else indexedToRGB(index))
+                result.append(base + basic if basic < 8 else base + 60 + basic - 8)
+
+        elif level == 'none' and (30 <= param <= 49 or 90 <= param <= 107):
+            continue
+
+        else:
+            result.append(param)
+
+    return result
+
+
+def downgradeSGR(text, level):
+    '''Rewrite the SGR (color/style) sequences in `text` to only use colors supported at the given color level.
+
+    '''
+    if level == 'truecolor':
+        return text
+
+    def replace(match):
+        if not match.group(1):
+            return match.group(0)
+
+        params = [int(param) if param else 0 for param in match.group(1).split(';')]
+        downgraded = _downgradeParams(params, level)
+        return csi(*downgraded) if downgraded else ''
+
+    return sgrRE.sub(replace, text)
+
+
+colorLevel = detectColorLevel()
+
+_formatter = string.Formatter()
+_templateCache = {}
+
+
+def _escapeFormat(text):
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class StyleTemplate(object):
+    '''A format string whose `{c.…}` style placeholders have been resolved ahead of time.
+
+    Styles are looked up on `colors` once, when the template is compiled, and downgraded to what `colorLevel` allows
+    (or wrapped for readline prompts, if `prompt` is true). Formatting the template then only has to fill in the
+    remaining placeholders; templates without any are just a constant `text`.
+
+    '''
+    def __init__(self, template, prompt=False, level=None):
+        super().__init__()
+
+        level = colorLevel if level is None else level
+
+        parts = []
+        hasFields = False
+        for literal, fieldName, formatSpec, conversion in _formatter.parse(template):
+            parts.append(_escapeFormat(literal))
+            if fieldName is None:
+                continue
+
+            if fieldName == 'c' or fieldName.startswith(('c.', 'c[')):
+                style = str(_formatter.get_field(fieldName, (), {'c': colors})[0])
+                if level == '16':
+                    style = str(colors.basicFallbacks.get(style, style))
+                style = downgradeSGR(style, level)
+                if prompt and style:
+                    style = ReadlinePromptWrapper.format(style)
+                parts.append(_escapeFormat(style))
+            else:
+                hasFields = True
+                parts.append('{{{}{}{}}}'.format(
+                    fieldName, '!' + conversion if conversion else '', ':' + formatSpec if formatSpec else ''
+                ))
+
+        self.formatString = ''.join(parts)
+        self.text = None if hasFields else self.formatString.format()
+
+    def format(self, *args, **kwargs):
+        if self.text is not None:
+            return self.text
+
+        return self.formatString.format(*args, **kwargs)
+
+    def __str__(self):
+        return self.text if self.text is not None else self.formatString
+
+
+def template(text, prompt=False):
+    '''Return the compiled (and cached) `StyleTemplate` for `text`.
+
+    '''
+    key = (text, prompt)
+    try:
+        return _templateCache[key]
+    except KeyError:
+        compiled = _templateCache[key] = StyleTemplate(text, prompt)
+        return compiled
+
+
+def setColorLevel(level):
+    '''Override the detected color level; templates compiled from now on will use it.
+
+    '''
+    global colorLevel  # pylint: disable=global-statement
+
+    if level not in colorLevels:
+        raise ValueError('unknown color level {!r}; expected one of {}'.format(level, ', '.join(colorLevels)))
+
+    colorLevel = level
+    _templateCache.clear()